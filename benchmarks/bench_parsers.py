@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import sqlite3 as sq
+import tempfile
+import tracemalloc
+import argparse
+import importlib.util
+import importlib.machinery
+import synthetic_pool
+
+
+# Repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The monitor scripts import their shared database module from the monitor directory
+sys.path.insert(0, os.path.join(ROOT, "monitor"))
+
+
+# Parse command-line options
+###########################################
+def options():
+    """Parse command-line options
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the parse, aggregate, and database write stages of the "
+                                                 "HTCondor monitoring tools on a synthetic pool.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--sizes", help="One or more (comma-separated) pool sizes (jobs/slots).",
+                        default="1000,100000,1000000")
+    parser.add_argument("-t", "--tools", help="One or more (comma-separated) tools to benchmark.",
+                        default="condor_fullstat,htcondor_job_monitor,htcondor_usage_logger")
+    parser.add_argument("-c", "--db-config", help="Database configuration JSON file for the htcondor_job_monitor "
+                                                  "write stage. Use a scratch database, the benchmark rows are "
+                                                  "committed. A temporary SQLite database is used if not provided.")
+    parser.add_argument("-j", "--json", help="Append results as JSON lines to this file.")
+    parser.add_argument("--no-tracemalloc", help="Do not measure peak memory. tracemalloc slows down "
+                                                 "allocation-heavy stages.", action="store_true")
+    parser.add_argument("--seed", help="Random number generator seed.", type=int, default=0)
+    args = parser.parse_args()
+
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+    args.tools = args.tools.split(",")
+
+    return args
+
+
+# Main
+###########################################
+def main():
+    """Main program.
+    """
+    args = options()
+
+    benchmarks = {
+        "condor_fullstat": bench_fullstat,
+        "htcondor_job_monitor": bench_job_monitor,
+        "htcondor_usage_logger": bench_usage_logger
+    }
+    for tool in args.tools:
+        if tool not in benchmarks:
+            print("Unknown tool {0}".format(tool), file=sys.stderr)
+            sys.exit(1)
+
+    out = None
+    if args.json:
+        out = open(args.json, "a")
+
+    print("\t".join(["Tool", "Stage", "Records", "Seconds", "Records/s", "Peak (MiB)"]))
+    for size in args.sizes:
+        # Generate the pool once per size, outside of the timed stages
+        pool = synthetic_pool.synthetic_pool(jobs=size, seed=args.seed)
+        for tool in args.tools:
+            for result in benchmarks[tool](pool=pool, size=size, args=args):
+                result["tool"] = tool
+                result["size"] = size
+                print_result(result)
+                if out is not None:
+                    out.write(json.dumps(result) + "\n")
+
+    if out is not None:
+        out.close()
+
+
+# Load a tool as a module
+###########################################
+def load_tool(name, path):
+    """Import a script (with or without a .py extension) as a module without running it.
+
+    :param name: str
+    :param path: str
+    :return module: module
+    """
+    loader = importlib.machinery.SourceFileLoader(name, os.path.join(ROOT, path))
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+# Time a benchmark stage
+###########################################
+def run_stage(stage, records, func, args):
+    """Run one stage and measure its wall time and peak traced memory.
+
+    :param stage: str
+    :param records: int
+    :param func: function
+    :param args: argparse object
+    :return result: dict
+    :return value: object
+    """
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if not args.no_tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+
+    result = {"stage": stage, "records": records, "seconds": seconds,
+              "throughput": records / seconds if seconds > 0 else None, "peak_mib": peak}
+    return result, value
+
+
+# Print a benchmark result
+###########################################
+def print_result(result):
+    """Print a benchmark result as a tab-delimited row.
+
+    :param result: dict
+    """
+    throughput = "-" if result["throughput"] is None else "{0:.0f}".format(result["throughput"])
+    peak = "-" if result["peak_mib"] is None else "{0:.1f}".format(result["peak_mib"])
+    print("\t".join([result["tool"], result["stage"], str(result["records"]), "{0:.3f}".format(result["seconds"]),
+                     throughput, peak]))
+    sys.stdout.flush()
+
+
+# condor_fullstat
+###########################################
+def bench_fullstat(pool, size, args):
+    """Benchmark the condor_fullstat parse and aggregate stages.
+
+    :param pool: dict
+    :param size: int
+    :param args: argparse object
+    :return results: list
+    """
+    fullstat = load_tool("condor_fullstat", "condor_fullstat")
+    jobs_raw = synthetic_pool.condor_q(pool, synthetic_pool.FULLSTAT_JOB_ATTRS)
+    loads_raw = synthetic_pool.condor_status_loads(pool)
+    machines_raw = synthetic_pool.condor_status_machines(pool)
+
+    def parse():
+        loads = fullstat.parse_loads(rows=fullstat.split_rows(loads_raw))
+        columns = fullstat.parse_jobs(rows=fullstat.split_rows(jobs_raw), loads=loads)
+        servers = fullstat.parse_machines(rows=fullstat.split_rows(machines_raw))
+        return columns, servers
+
+    def aggregate():
+        table = fullstat.job_table(columns)
+        summaries = [fullstat.summarize(columns=columns, key=key) for key in ["owner", "group", "host"]]
+        return table, summaries
+
+    results = []
+    result, (columns, servers) = run_stage("parse", size, parse, args)
+    results.append(result)
+    result, _ = run_stage("aggregate", len(columns["cluster"]), aggregate, args)
+    results.append(result)
+    return results
+
+
+# htcondor_job_monitor.py
+###########################################
+def bench_job_monitor(pool, size, args):
+    """Benchmark the htcondor_job_monitor.py parse and database write stages.
+
+    :param pool: dict
+    :param size: int
+    :param args: argparse object
+    :return results: list
+    """
+    monitor = load_tool("htcondor_job_monitor", os.path.join("monitor", "htcondor_job_monitor.py"))
+    jobs_raw = synthetic_pool.condor_q(pool, synthetic_pool.MONITOR_JOB_ATTRS)
+    loads_raw = synthetic_pool.condor_status_loads(pool)
+
+    def parse():
+        loads = monitor.parse_loads(raw=loads_raw)
+        return monitor.parse_jobs(raw=jobs_raw, loads=loads)
+
+    results = []
+    result, jobs = run_stage("parse", size, parse, args)
+    results.append(result)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db_config:
+            with open(args.db_config, "r") as fh:
+                conf = json.load(fh)
+        else:
+            conf = {"engine": "sqlite", "database": os.path.join(tmp, "job_stats.sqlite3")}
+            connect = sq.connect(conf["database"])
+            with open(os.path.join(ROOT, "monitor", "htcondor_job_stats_db_schema_sqlite.sql"), "r") as fh:
+                connect.executescript(fh.read())
+            connect.close()
+        db = monitor.htcondor_db.connect(conf=conf)
+        c = monitor.htcondor_db.cursor(db)
+        # The first poll inserts every job, the second only looks them up and applies the dead-band
+        result, _ = run_stage("db_write_new", len(jobs), lambda: monitor.write_stats(db=db, c=c, jobs=jobs), args)
+        results.append(result)
+        deadband = {"cpu_load": 0.25, "memory_usage": 128, "disk_usage": 1048576, "max_gap": 900}
+        result, _ = run_stage("db_write_known", len(jobs),
+                              lambda: monitor.write_stats(db=db, c=c, jobs=jobs, deadband=deadband), args)
+        results.append(result)
+        c.close()
+        db.close()
+    return results
+
+
+# htcondor_usage_logger.py
+###########################################
+def bench_usage_logger(pool, size, args):
+    """Benchmark the htcondor_usage_logger.py parse and database write stages.
+
+    The write stage uses a temporary SQLite database built from monthly_report_db_schema.sql.
+
+    :param pool: dict
+    :param size: int
+    :param args: argparse object
+    :return results: list
+    """
+    logger = load_tool("htcondor_usage_logger", os.path.join("monitor", "htcondor_usage_logger.py"))
+    report = synthetic_pool.condor_userprio(jobs=size, seed=args.seed)
+
+    results = []
+    result, (users, groups) = run_stage("parse", size, lambda: logger.parse_usage(report=report), args)
+    results.append(result)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connect = sq.connect(os.path.join(tmp, "usage.sqlite3"))
+        with open(os.path.join(ROOT, "monitor", "monthly_report_db_schema.sql"), "r") as fh:
+            connect.executescript(fh.read())
+        # The first snapshot only stores the usage, the second also computes the usage since the first
+        result, _ = run_stage("db_write", len(users) + len(groups),
+                              lambda: logger.write_usage(connect=connect, date="2026-01-01 00:00:00", users=users,
+                                                         groups=groups), args)
+        results.append(result)
+        result, _ = run_stage("db_write_interval", len(users) + len(groups),
+                              lambda: logger.write_usage(connect=connect, date="2026-01-01 01:00:00", users=users,
+                                                         groups=groups), args)
+        results.append(result)
+        connect.close()
+    return results
+
+
+if __name__ == '__main__':
+    main()
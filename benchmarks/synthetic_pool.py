@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+import os
+import random
+import argparse
+
+
+# Attributes of a synthetic job, in the order they are generated
+JOB_ATTRS = ["ClusterId", "ProcId", "Owner", "RemoteHost", "RequestCpus", "RequestMemory", "MemoryUsage",
+             "RequestDisk", "DiskUsage", "JobStartDate", "ServerTime", "Cmd", "JobDescription", "AcctGroup",
+             "JobUniverse", "WantDocker", "ShouldTransferFiles", "GlobalJobId"]
+
+# condor_q projection used by condor_fullstat
+FULLSTAT_JOB_ATTRS = ["ClusterId", "ProcId", "Owner", "RemoteHost", "RequestCpus", "RequestMemory", "MemoryUsage",
+                      "RequestDisk", "DiskUsage", "JobStartDate", "ServerTime", "Cmd", "JobDescription", "AcctGroup"]
+
+# condor_q projection used by htcondor_job_monitor.py
+MONITOR_JOB_ATTRS = ["ClusterId", "ProcId", "Owner", "RemoteHost", "RequestCpus", "RequestMemory", "MemoryUsage",
+                     "RequestDisk", "DiskUsage", "JobStartDate", "ServerTime", "Cmd", "JobUniverse", "WantDocker",
+                     "ShouldTransferFiles", "AcctGroup", "GlobalJobId"]
+
+# Executables picked for synthetic jobs
+COMMANDS = ["/usr/bin/bwa", "/bioinfo/bin/fastq-dump", "/opt/gatk/gatk", "/usr/local/bin/python3", "/bin/sleep",
+            "/usr/bin/samtools", "/usr/bin/Rscript"]
+
+
+# Parse command-line options
+###########################################
+def options():
+    """Parse command-line options
+    """
+    parser = argparse.ArgumentParser(description="Write synthetic HTCondor query output for testing and "
+                                                 "benchmarking.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-n", "--jobs", help="Number of jobs (and slots) in the synthetic pool.", type=int,
+                        default=1000)
+    parser.add_argument("-o", "--outdir", help="Output directory.", required=True)
+    parser.add_argument("--seed", help="Random number generator seed.", type=int, default=0)
+    args = parser.parse_args()
+
+    return args
+
+
+# Main
+###########################################
+def main():
+    """Main program.
+
+    Writes a condor_fullstat fixture directory plus the condor_q and condor_userprio output read by the monitor
+    scripts.
+    """
+    args = options()
+
+    pool = synthetic_pool(jobs=args.jobs, seed=args.seed)
+    os.makedirs(args.outdir, exist_ok=True)
+
+    outputs = {
+        # condor_fullstat --backend fixture files
+        "condor_q.txt": condor_q(pool, FULLSTAT_JOB_ATTRS),
+        "condor_status_loads.txt": condor_status_loads(pool),
+        "condor_status_machines.txt": condor_status_machines(pool),
+        # htcondor_job_monitor.py and htcondor_usage_logger.py input
+        "condor_q_monitor.txt": condor_q(pool, MONITOR_JOB_ATTRS),
+        "condor_userprio.txt": condor_userprio(jobs=args.jobs, seed=args.seed)
+    }
+    for filename, text in outputs.items():
+        with open(os.path.join(args.outdir, filename), "w") as fh:
+            fh.write(text)
+
+
+# Generate a synthetic pool
+###########################################
+def synthetic_pool(jobs, seed=0):
+    """Generate a pool with one slot per job.
+
+    About 70% of the jobs are running, the rest are idle and have undefined host, usage, and start date values like
+    a real queue.
+
+    :param jobs: int
+    :param seed: int
+    :return pool: dict
+    """
+    rng = random.Random(seed)
+    server_time = 1700000000
+    # Roughly 32 slots per machine
+    machines = max(1, jobs // 32)
+    owners = ["user{0}".format(i) for i in range(max(1, min(500, jobs // 20)))]
+    groups = ["group_{0}".format(name) for name in ["bioinfo", "imaging", "genomics", "ml", "field", "core"]]
+
+    job_rows = []
+    slot_rows = []
+    for i in range(jobs):
+        cluster = 1000 + i // 10
+        process = i % 10
+        owner = rng.choice(owners)
+        request_cpus = rng.choice([1, 1, 2, 4, 8, 16])
+        request_memory = rng.choice([1024, 2048, 4096, 8192, 16384, 65536])
+        request_disk = rng.choice([1048576, 10485760, 104857600])
+        cmd = rng.choice(COMMANDS)
+        machine = "node{0}.example.org".format(i % machines)
+        running = rng.random() < 0.7
+        if running:
+            host = "slot1_{0}@{1}".format(i // machines + 1, machine)
+            memory_usage = str(int(request_memory * rng.uniform(0.05, 1.5)))
+            disk_usage = str(int(request_disk * rng.uniform(0.0, 1.2)))
+            start = str(server_time - rng.randint(1, 30 * 86400))
+        else:
+            host = "undefined"
+            memory_usage = "undefined"
+            disk_usage = "undefined"
+            start = "undefined"
+        description = "interactive job" if cmd == "/bin/sleep" else "undefined"
+        universe = rng.choice([5, 5, 5, 5, 7, 12])
+        job_rows.append([str(cluster), str(process), owner, host, str(request_cpus), str(request_memory),
+                         memory_usage, str(request_disk), disk_usage, start, str(server_time), cmd, description,
+                         rng.choice(groups), str(universe), rng.choice(["true", "false", "undefined"]),
+                         rng.choice(["YES", "NO", "IF_NEEDED"]),
+                         "submit.example.org#{0}.{1}#{2}".format(cluster, process, server_time - 86400)])
+
+        # The slot running (or available for) this job
+        if running:
+            slot_rows.append([machine, "Busy", str(request_cpus), str(request_memory), str(request_disk),
+                              "{0}.{1}".format(cluster, process), "{0:.6f}".format(request_cpus *
+                                                                               rng.uniform(0.0, 1.3))])
+        else:
+            slot_rows.append([machine, "Idle", str(rng.choice([1, 2, 4])), str(rng.choice([2048, 4096])),
+                              str(rng.choice([1048576, 10485760])), "undefined", "0.000000"])
+
+    return {"jobs": job_rows, "slots": slot_rows}
+
+
+# condor_q -autoformat:t output
+###########################################
+def condor_q(pool, attrs):
+    """Format synthetic jobs as condor_q -autoformat:t output.
+
+    :param pool: dict
+    :param attrs: list
+    :return text: str
+    """
+    index = [JOB_ATTRS.index(attr) for attr in attrs]
+    lines = []
+    for row in pool["jobs"]:
+        lines.append("\t".join([row[i] for i in index]))
+    return "\n".join(lines) + "\n"
+
+
+# condor_status -autoformat:t JobId LoadAvg output
+###########################################
+def condor_status_loads(pool):
+    """Format synthetic slots as condor_status -autoformat:t JobId LoadAvg output.
+
+    :param pool: dict
+    :return text: str
+    """
+    lines = []
+    for row in pool["slots"]:
+        lines.append(row[5] + "\t" + row[6])
+    return "\n".join(lines) + "\n"
+
+
+# condor_status -autoformat:t Machine Activity Cpus Memory Disk output
+###########################################
+def condor_status_machines(pool):
+    """Format synthetic slots as condor_status -autoformat:t Machine Activity Cpus Memory Disk output.
+
+    :param pool: dict
+    :return text: str
+    """
+    lines = []
+    for row in pool["slots"]:
+        lines.append("\t".join(row[:5]))
+    return "\n".join(lines) + "\n"
+
+
+# condor_userprio -autoformat:r Name WeightedAccumulatedUsage output
+###########################################
+def condor_userprio(jobs, seed=0):
+    """Format synthetic submitters as condor_userprio -allusers -autoformat:r Name WeightedAccumulatedUsage output.
+
+    One row is written per job, most rows are users with an accounting group, the rest are group totals and users
+    without a group.
+
+    :param jobs: int
+    :param seed: int
+    :return text: str
+    """
+    rng = random.Random(seed)
+    domains = ["ddpsc.org", "datasci.danforthcenter.org"]
+    groups = ["bioinfo", "imaging", "genomics", "ml", "field", "core"]
+    lines = []
+    for i in range(jobs):
+        usage = "{0:.6f}".format(rng.uniform(0, 1e7))
+        kind = rng.random()
+        if kind < 0.05:
+            lines.append('"group_{0}" {1}'.format(rng.choice(groups), usage))
+        elif kind < 0.15:
+            lines.append('"user{0}@{1}" {2}'.format(i, rng.choice(domains), usage))
+        else:
+            lines.append('"group_{0}.user{1}@{2}" {3}'.format(rng.choice(groups), i, rng.choice(domains), usage))
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+"""Workflow runner shared by the dask workflows.
+
+A workflow is a list of tasks built with task(): a command, the files it reads and writes, and the CPUs and memory
+it needs. run() starts an HTCondorCluster (or a LocalCluster with --local for testing), skips tasks whose outputs
+are newer than their inputs, runs the others, retries tasks that exit with a non-zero return code, and writes a
+manifest with the status and timing of every task. Workflow scripts only parse their options and build the tasks.
+
+Tasks given an outdir write to their staging_directory() and their files are moved into outdir only when the
+command succeeds, so an interrupted task never leaves an output that looks complete. Outputs are also only trusted
+if the previous manifest recorded the task as finished.
+
+The number of workers follows the number of tasks that have not finished: it grows up to the maximum while tasks
+are queued and idle workers are retired as the queue drains. The worker-seconds paid for and the task-seconds used
+are printed at the end of the run.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import socket
+from subprocess import call
+from dask_jobqueue import HTCondorCluster, JobQueueCluster
+from dask.distributed import Adaptive, Client, LocalCluster, SchedulerPlugin, as_completed
+from dask.utils import parse_bytes
+
+
+def add_runner_options(parser, name, max_jobs):
+    """Add the runner and scaling options to a workflow parser.
+
+    :param parser: argparse.ArgumentParser
+    :param name: str
+    :param max_jobs: int
+    """
+    parser.add_argument("--manifest", type=str, default=f"{name}.manifest.json",
+                        help="Run manifest JSON file. Tasks are only skipped if the previous run recorded them as "
+                             "finished in it (default: %(default)s).")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Times a failed task is retried (default: %(default)s).")
+    parser.add_argument("--force", action="store_true", help="Run every task, even if its outputs are up to date.")
+    parser.add_argument("--local", action="store_true",
+                        help="Run the tasks on a LocalCluster on this machine instead of HTCondor.")
+    add_scaling_options(parser, max_jobs=max_jobs)
+
+
+def task(name, command, inputs=None, outputs=None, cpus=1, memory=None, outdir=None):
+    """Describe one workflow task.
+
+    With outdir, the command must write its files to staging_directory(outdir, name). They are moved into outdir
+    when the command succeeds.
+
+    :param name: str
+    :param command: list
+    :param inputs: list
+    :param outputs: list
+    :param cpus: int
+    :param memory: str
+    :param outdir: str
+    :return task: dict
+    """
+    return {"name": name, "command": command, "inputs": inputs or [], "outputs": outputs or [], "cpus": cpus,
+            "memory": memory, "outdir": outdir}
+
+
+def staging_directory(outdir, name):
+    """Get the directory a task writes to before its files are moved into outdir.
+
+    :param outdir: str
+    :param name: str
+    :return staging: str
+    """
+    return os.path.join(outdir, ".partial", name)
+
+
+def run(args, tasks, cluster_options):
+    """Run the workflow tasks.
+
+    Every worker advertises the CPUs and memory of its job as dask resources, so a task only runs on a worker
+    with room for it.
+
+    :param args: argparse.Namespace
+    :param tasks: list
+    :param cluster_options: dict
+    :return status: int
+    """
+    worker_resources = {"CPU": cluster_options["cores"], "MEMORY": parse_bytes(cluster_options["memory"])}
+    names = set()
+    for spec in tasks:
+        if spec["name"] in names:
+            raise ValueError(f"Task {spec['name']} is defined more than once")
+        names.add(spec["name"])
+        for resource, amount in task_resources(spec).items():
+            if amount > worker_resources[resource]:
+                raise ValueError(f"Task {spec['name']} needs more {resource} than a {cluster_options['job_name']} "
+                                 f"job has")
+
+    previous = load_manifest(args.manifest).get("tasks", {})
+    manifest = {"started": time.time(), "tasks": {}}
+    queued = []
+    for spec in tasks:
+        # Tasks that failed or were interrupted can leave outputs behind that look up to date
+        finished = previous.get(spec["name"], {}).get("status") in ["success", "skipped"]
+        if not args.force and finished and up_to_date(spec):
+            manifest["tasks"][spec["name"]] = {"status": "skipped", "command": spec["command"]}
+        else:
+            manifest["tasks"][spec["name"]] = {"status": "pending", "command": spec["command"]}
+            queued.append(spec)
+    print(f"{len(tasks) - len(queued)} of {len(tasks)} tasks are up to date", file=sys.stderr)
+    # Queued tasks stay pending in the manifest until they finish, even if this run is interrupted
+    save_manifest(args.manifest, manifest)
+    if len(queued) == 0:
+        return 0
+
+    cluster = start_cluster(args, cluster_options, worker_resources)
+    client = Client(cluster)
+    track_usage(client)
+
+    # Running futures and the task and attempt number of each
+    running = {}
+    # Scale the number of jobs to the unfinished tasks
+    adapt(cluster, args, pending=lambda: len(running))
+
+    def submit(spec, attempt):
+        staging = None
+        if spec["outdir"] is not None:
+            staging = staging_directory(spec["outdir"], spec["name"])
+        future = client.submit(run_task, spec["command"], staging=staging, outdir=spec["outdir"],
+                               key=f"{spec['name']}-{attempt}", resources=task_resources(spec))
+        running[future] = (spec, attempt)
+        return future
+
+    futures = as_completed([submit(spec, 1) for spec in queued])
+    done = 0
+    failed = []
+    for future in futures:
+        spec, attempt = running.pop(future)
+        if future.status == "error":
+            result = {"returncode": None, "error": repr(future.exception())}
+        else:
+            result = future.result()
+        result["attempts"] = attempt
+        result["command"] = spec["command"]
+        if result["returncode"] == 0:
+            result["status"] = "success"
+        elif attempt <= args.retries:
+            print(f"{spec['name']} failed (return code {result['returncode']}), retrying", file=sys.stderr)
+            futures.add(submit(spec, attempt + 1))
+            continue
+        else:
+            result["status"] = "failed"
+            failed.append(spec["name"])
+        done += 1
+        print(f"[{done}/{len(queued)}] {spec['name']} {result['status']}", file=sys.stderr)
+        manifest["tasks"][spec["name"]] = result
+        save_manifest(args.manifest, manifest)
+
+    manifest["finished"] = time.time()
+    manifest["usage"] = report_usage(client)
+    save_manifest(args.manifest, manifest)
+    client.close()
+    cluster.close()
+
+    if len(failed) > 0:
+        print(f"{len(failed)} tasks failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def task_resources(spec):
+    """Get the dask resources a task needs.
+
+    :param spec: dict
+    :return resources: dict
+    """
+    resources = {"CPU": spec["cpus"]}
+    if spec["memory"] is not None:
+        resources["MEMORY"] = parse_bytes(spec["memory"])
+    return resources
+
+
+def start_cluster(args, cluster_options, worker_resources):
+    """Start the cluster that runs the tasks, without any workers until it is scaled.
+
+    :param args: argparse.Namespace
+    :param cluster_options: dict
+    :param worker_resources: dict
+    :return cluster: dask_jobqueue.HTCondorCluster or dask.distributed.LocalCluster
+    """
+    if args.local:
+        return LocalCluster(n_workers=0, threads_per_worker=cluster_options["cores"],
+                            memory_limit=cluster_options["memory"], resources=worker_resources)
+    # One worker process per job, so the job's resources are not advertised once per process
+    return HTCondorCluster(processes=1, worker_extra_args=["--resources", ",".join(
+        [f"{resource}={amount}" for resource, amount in worker_resources.items()])], **cluster_options)
+
+
+def run_task(command, staging=None, outdir=None):
+    """Run a task command on a worker.
+
+    With a staging directory, files left by an earlier attempt are removed first, and the files the command writes
+    are moved into outdir if it succeeds.
+
+    :param command: list
+    :param staging: str
+    :param outdir: str
+    :return result: dict
+    """
+    if staging is not None:
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+    start = time.time()
+    returncode = call(command)
+    if staging is not None and returncode == 0:
+        for filename in os.listdir(staging):
+            os.replace(os.path.join(staging, filename), os.path.join(outdir, filename))
+        os.rmdir(staging)
+    end = time.time()
+    return {"returncode": returncode, "start": start, "end": end, "seconds": end - start,
+            "host": socket.gethostname()}
+
+
+def up_to_date(spec):
+    """Check whether every output of a task exists and is newer than all of its inputs.
+
+    Tasks without outputs are never up to date.
+
+    :param spec: dict
+    :return up_to_date: bool
+    """
+    if len(spec["outputs"]) == 0:
+        return False
+    try:
+        oldest_output = min([os.stat(output).st_mtime for output in spec["outputs"]])
+        newest_input = max([os.stat(path).st_mtime for path in spec["inputs"]], default=0)
+    except FileNotFoundError:
+        return False
+    return oldest_output >= newest_input
+
+
+def load_manifest(filename):
+    """Load the manifest of the previous run.
+
+    :param filename: str
+    :return manifest: dict
+    """
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, "r") as fh:
+        return json.load(fh)
+
+
+def save_manifest(filename, manifest):
+    """Save the manifest, replacing the file atomically.
+
+    :param filename: str
+    :param manifest: dict
+    """
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp, filename)
+
+
+def add_scaling_options(parser, max_jobs):
+    """Add the adaptive scaling options to a workflow parser.
+
+    :param parser: argparse.ArgumentParser
+    :param max_jobs: int
+    """
+    parser.add_argument("--min-jobs", type=int, default=0,
+                        help="Minimum number of HTCondor jobs kept running (default: %(default)s).")
+    parser.add_argument("--max-jobs", type=int, default=max_jobs,
+                        help="Maximum number of HTCondor jobs (default: %(default)s).")
+    parser.add_argument("--tasks-per-worker", type=int, default=1,
+                        help="Target number of unfinished tasks per worker (default: %(default)s).")
+    parser.add_argument("--scale-down-wait", type=float, default=10,
+                        help="Seconds a worker stays idle before its job is removed (default: %(default)s).")
+
+
+def adapt(cluster, args, pending):
+    """Scale the cluster to the number of unfinished tasks.
+
+    :param cluster: dask_jobqueue.HTCondorCluster
+    :param args: argparse.Namespace
+    :param pending: function that returns the number of unfinished tasks
+    :return adaptive: QueueDepthAdaptive
+    """
+    interval = 1
+    # HTCondorCluster scales jobs, a LocalCluster used for testing scales workers
+    if isinstance(cluster, JobQueueCluster):
+        limits = {"minimum_jobs": args.min_jobs, "maximum_jobs": args.max_jobs}
+    else:
+        limits = {"minimum": args.min_jobs, "maximum": args.max_jobs}
+    return cluster.adapt(Adaptive=QueueDepthAdaptive, pending=pending, tasks_per_worker=args.tasks_per_worker,
+                         interval=interval, wait_count=max(1, math.ceil(args.scale_down_wait / interval)), **limits)
+
+
+class QueueDepthAdaptive(Adaptive):
+    """Adaptive scaling with a target number of unfinished tasks per worker.
+
+    The default target is based on the scheduler's estimate of task durations, which is poor for workflows where
+    every task is one long external command. Here the target is the number of unfinished tasks divided by
+    tasks_per_worker, bounded by the minimum and maximum.
+    """
+
+    def __init__(self, *args, pending=None, tasks_per_worker=1, **kwargs):
+        self.pending = pending
+        self.tasks_per_worker = tasks_per_worker
+        super().__init__(*args, **kwargs)
+
+    async def target(self):
+        return math.ceil(self.pending() / self.tasks_per_worker)
+
+
+class UsagePlugin(SchedulerPlugin):
+    """Scheduler plugin that adds up worker connected time and task compute time.
+
+    CPU-seconds count each worker by its CPU resource (or its threads) and each task by the CPUs it requested, so
+    tasks that use a whole multi-core worker are not counted as mostly idle.
+    """
+
+    name = "workflow-usage"
+
+    def __init__(self):
+        self.scheduler = None
+        # Connect time and CPUs of each connected worker
+        self.workers = {}
+        self.worker_count = 0
+        self.worker_seconds = 0
+        self.worker_cpu_seconds = 0
+        self.task_seconds = 0
+        self.task_cpu_seconds = 0
+        self.tasks = 0
+
+    def start(self, scheduler):
+        self.scheduler = scheduler
+
+    def add_worker(self, scheduler, worker):
+        state = scheduler.workers[worker]
+        self.workers[worker] = (time.time(), state.resources.get("CPU", state.nthreads))
+        self.worker_count += 1
+
+    def remove_worker(self, scheduler, worker, **kwargs):
+        if worker in self.workers:
+            started, cpus = self.workers.pop(worker)
+            seconds = time.time() - started
+            self.worker_seconds += seconds
+            self.worker_cpu_seconds += seconds * cpus
+
+    def transition(self, key, start, finish, *args, **kwargs):
+        # Finished tasks, successful or not, report how long they ran on the worker
+        if start == "processing" and finish in ["memory", "erred"]:
+            self.tasks += 1
+            cpus = 1
+            if self.scheduler is not None and key in self.scheduler.tasks:
+                cpus = (self.scheduler.tasks[key].resource_restrictions or {}).get("CPU", 1)
+            for startstop in kwargs.get("startstops", []):
+                if startstop["action"] == "compute":
+                    self.task_seconds += startstop["stop"] - startstop["start"]
+                    self.task_cpu_seconds += (startstop["stop"] - startstop["start"]) * cpus
+
+    def usage(self):
+        """Get the totals, counting connected workers up to now.
+
+        :return usage: dict
+        """
+        now = time.time()
+        usage = {
+            "workers": self.worker_count,
+            "worker_seconds": self.worker_seconds + sum([now - started for started, _ in self.workers.values()]),
+            "worker_cpu_seconds": self.worker_cpu_seconds + sum([(now - started) * cpus
+                                                                 for started, cpus in self.workers.values()]),
+            "task_seconds": self.task_seconds,
+            "task_cpu_seconds": self.task_cpu_seconds,
+            "tasks": self.tasks
+        }
+        return usage
+
+
+def track_usage(client):
+    """Start recording worker and task time on the scheduler.
+
+    Call before scaling the cluster so that every worker is counted.
+
+    :param client: dask.distributed.Client
+    """
+    client.register_plugin(UsagePlugin())
+
+
+def scheduler_usage(dask_scheduler):
+    """Get the usage totals from the scheduler plugin.
+
+    :param dask_scheduler: distributed.Scheduler
+    :return usage: dict
+    """
+    return dask_scheduler.plugins[UsagePlugin.name].usage()
+
+
+def report_usage(client, file=sys.stderr):
+    """Print the worker-seconds used and the task-seconds executed.
+
+    Worker time is counted from when a worker connects to the scheduler, the time HTCondor jobs spend starting is
+    not included.
+
+    :param client: dask.distributed.Client
+    :param file: file object
+    :return usage: dict
+    """
+    usage = client.run_on_scheduler(scheduler_usage)
+    cpu_seconds = usage["worker_cpu_seconds"]
+    utilization = usage["task_cpu_seconds"] / cpu_seconds if cpu_seconds > 0 else 0
+    print(f"Workers: {usage['workers']}, worker-seconds: {usage['worker_seconds']:.1f}, "
+          f"CPU-seconds: {cpu_seconds:.1f}", file=file)
+    print(f"Tasks: {usage['tasks']}, task-seconds: {usage['task_seconds']:.1f}, "
+          f"CPU-seconds: {usage['task_cpu_seconds']:.1f}", file=file)
+    print(f"Utilization: {utilization:.1%}, idle CPU-seconds: {cpu_seconds - usage['task_cpu_seconds']:.1f}",
+          file=file)
+    return usage
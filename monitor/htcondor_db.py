@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""Database helpers shared by the HTCondor job statistics tools.
+
+The configuration JSON file selects the database engine with the optional "engine" key, "mysql" (the default) or
+"sqlite". For SQLite, "database" is the database filename and the other keys are ignored.
+
+Queries are written once with MySQL %s placeholders, SQLite cursors translate them to ? placeholders. Cursors from
+both engines return rows as dictionaries.
+"""
+import sqlite3 as sq
+
+
+# Connect to the database
+###########################################
+def connect(conf):
+    """Connect to the database described by the configuration.
+
+    :param conf: dict
+    :return db: database connection
+    """
+    if engine(conf) == "sqlite":
+        db = sq.connect(conf["database"])
+        # Replace the row_factory result constructor with a dictionary constructor
+        db.row_factory = dict_factory
+        return db
+    import MySQLdb
+
+    return MySQLdb.connect(host=conf["hostname"], db=conf["database"], user=conf["username"],
+                           passwd=conf["password"])
+
+
+# Database engine name
+###########################################
+def engine(conf):
+    """Get the configured database engine.
+
+    :param conf: dict
+    :return engine: str
+    """
+    name = conf.get("engine", "mysql")
+    if name not in ["mysql", "sqlite"]:
+        raise ValueError("Unknown database engine {0}".format(name))
+    return name
+
+
+# Create a cursor that returns dictionaries
+###########################################
+def cursor(db, stream=False):
+    """Create a database cursor that returns rows as dictionaries.
+
+    With stream, MySQL results are read from the server as they are fetched instead of being buffered in memory.
+    SQLite cursors always stream.
+
+    :param db: database connection
+    :param stream: bool
+    :return c: database cursor
+    """
+    if isinstance(db, sq.Connection):
+        return SQLiteCursor(db.cursor())
+    import MySQLdb
+
+    if stream:
+        return db.cursor(MySQLdb.cursors.SSDictCursor)
+    return db.cursor(MySQLdb.cursors.DictCursor)
+
+
+# Database exception classes
+###########################################
+def errors(conf):
+    """Get the base and connection-level exception classes of the configured engine.
+
+    :param conf: dict
+    :return error: Exception class
+    :return operational_error: Exception class
+    """
+    if engine(conf) == "sqlite":
+        return sq.Error, sq.OperationalError
+    import MySQLdb
+
+    return MySQLdb.Error, MySQLdb.OperationalError
+
+
+# Truncate a datetime column to the hour or day
+###########################################
+def truncate_datetime(conf, column, unit):
+    """Get an SQL expression that truncates a datetime column to the start of the hour or day.
+
+    :param conf: dict
+    :param column: str
+    :param unit: str
+    :return expression: str
+    """
+    formats = {"hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+    if engine(conf) == "sqlite":
+        return "strftime('{0}', {1})".format(formats[unit], column)
+    # Literal % characters are doubled because MySQLdb formats parameters with %
+    return "DATE_FORMAT({0}, '{1}')".format(column, formats[unit].replace("%", "%%"))
+
+
+# Convert a datetime column to epoch seconds
+###########################################
+def epoch_seconds(conf, column):
+    """Get an SQL expression that converts a datetime column to epoch seconds.
+
+    :param conf: dict
+    :param column: str
+    :return expression: str
+    """
+    if engine(conf) == "sqlite":
+        return "CAST(ROUND((julianday({0}) - 2440587.5) * 86400) AS INTEGER)".format(column)
+    return "UNIX_TIMESTAMP({0})".format(column)
+
+
+# Raw samples with the time each one covers
+###########################################
+def sample_seconds_query(conf):
+    """Get a query of the raw job_stats samples in a datetime range with the seconds each sample covers.
+
+    With dead-band compression samples are stored unevenly in time, a sample stands for the job's usage until its
+    next stored sample. The last sample of a job covers 0 seconds. The query takes the start and end datetimes.
+
+    :param conf: dict
+    :return query: str
+    """
+    following = "(SELECT MIN(n.datetime) FROM job_stats n WHERE n.id = s.id AND n.datetime > s.datetime)"
+    return "SELECT s.id, s.datetime, s.cpu_load, s.memory_usage, s.disk_usage, COALESCE(" + \
+        epoch_seconds(conf=conf, column=following) + " - " + epoch_seconds(conf=conf, column="s.datetime") + \
+        ", 0) AS seconds FROM job_stats s WHERE s.datetime >= %s AND s.datetime < %s"
+
+
+# Update existing rows on a duplicate key
+###########################################
+def upsert_clause(conf, key, columns):
+    """Get the INSERT clause that updates columns of the existing row when the unique key is already present.
+
+    :param conf: dict
+    :param key: str
+    :param columns: list
+    :return clause: str
+    """
+    if engine(conf) == "sqlite":
+        return "ON CONFLICT({0}) DO UPDATE SET ".format(key) + ", ".join(
+            ["{0} = excluded.{0}".format(column) for column in columns])
+    return "ON DUPLICATE KEY UPDATE " + ", ".join(["{0} = VALUES({0})".format(column) for column in columns])
+
+
+# Dictionary factory for SQLite query results
+###########################################
+def dict_factory(cursor, row):
+    """
+    Replace the row_factory result constructor with a dictionary constructor.
+
+    Args:
+        cursor: (object) the sqlite3 database cursor object.
+        row: (list) a result list.
+    Returns:
+        d: (dictionary) sqlite3 results dictionary.
+    Raises:
+
+    """
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+
+# SQLite cursor with MySQL placeholders
+###########################################
+class SQLiteCursor(object):
+    """sqlite3 cursor that accepts %s placeholders like MySQLdb."""
+
+    def __init__(self, c):
+        self.c = c
+
+    def execute(self, query, params=()):
+        return self.c.execute(query.replace("%s", "?").replace("%%", "%"), params)
+
+    def executemany(self, query, params):
+        return self.c.executemany(query.replace("%s", "?").replace("%%", "%"), params)
+
+    def fetchone(self):
+        return self.c.fetchone()
+
+    def fetchall(self):
+        return self.c.fetchall()
+
+    def fetchmany(self, size):
+        return self.c.fetchmany(size)
+
+    def close(self):
+        self.c.close()
+
+    @property
+    def rowcount(self):
+        return self.c.rowcount
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+import argparse
+import json
+import htcondor_db
+
+
+# Report groupings and the jobs column each one is keyed on
+GROUPINGS = {
+    "user": "username",
+    "group": "groupname",
+    "exe": "exe"
+}
+
+# Report columns
+REPORT_COLUMNS = ["jobs", "samples", "core_hours", "cpu_efficiency", "core_hours_wasted", "memory_efficiency",
+                  "peak_memory_efficiency", "max_peak_memory_ratio", "memory_gib_hours_wasted"]
+
+
+# Parse command-line arguments
+###########################################
+def options():
+    """Parse command line options.
+
+    Args:
+
+    Returns:
+        argparse object.
+    Raises:
+
+    :return: argparse object
+    """
+
+    parser = argparse.ArgumentParser(description='HTCondor job resource efficiency report.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-c", "--config", help="Database configuration JSON file (MySQL, or SQLite with "
+                                               "\"engine\": \"sqlite\").", required=True)
+    parser.add_argument("-o", "--outfile", help="Report output prefix.", required=True)
+    parser.add_argument("-s", "--start", help="Report start date (YYYY-mm-dd).", required=True)
+    parser.add_argument("-e", "--end", help="Report end date (YYYY-mm-dd), not included.", required=True)
+    parser.add_argument("-b", "--by", help="One or more (comma-separated) report groupings.",
+                        default=",".join(GROUPINGS.keys()))
+    parser.add_argument("--chunk-size", help="Job rows fetched from the database at a time.", type=int,
+                        default=10000)
+    args = parser.parse_args()
+
+    args.by = args.by.split(",")
+    for by in args.by:
+        if by not in GROUPINGS:
+            parser.error("unknown report grouping {0}".format(by))
+
+    return args
+
+
+###########################################
+
+
+# Main
+###########################################
+def main():
+    """Main program.
+
+    Writes one report per grouping (outfile_user_efficiency.txt, ...), sorted by core-hours wasted.
+
+    Args:
+
+    Returns:
+
+    Raises:
+
+    """
+
+    # Get options
+    args = options()
+
+    # Read the database connection configuration file
+    config = open(args.config, "r")
+    # Load the JSON configuration data
+    conf = json.load(config)
+    config.close()
+
+    db = htcondor_db.connect(conf=conf)
+    # Stream the per-job rows instead of buffering them on the client
+    c = htcondor_db.cursor(db, stream=True)
+
+    totals = {}
+    for by in args.by:
+        totals[by] = {}
+
+    c.execute(job_usage_query(conf=conf), [args.start + " 00:00:00", args.end + " 00:00:00"] * 2)
+    while True:
+        rows = c.fetchmany(args.chunk_size)
+        if len(rows) == 0:
+            break
+        for row in rows:
+            job = job_efficiency(row)
+            for by in args.by:
+                add_job(totals=totals[by], key=row[GROUPINGS[by]], job=job)
+    c.close()
+    db.close()
+
+    for by in args.by:
+        write_report(filename=args.outfile + "_" + by + "_efficiency.txt", label=by.capitalize(), totals=totals[by])
+
+###########################################
+
+
+# Per-job usage query
+###########################################
+def job_usage_query(conf):
+    """
+    Build the query that aggregates the samples of each job in a date range on the database server.
+
+    Raw samples and the hourly rollups of compacted samples are both read, so the report also covers ranges that
+    have been compacted. Rollups keep their first and last sample times and the seconds their samples cover, so run
+    times and time-weighted means are the same before and after compaction. Rollups written before those columns
+    existed fall back to their hour and 0 seconds. The query takes the start and end datetimes twice, once for each
+    table.
+
+    :param conf: dict
+    :return query: str
+    """
+    first = htcondor_db.epoch_seconds(conf=conf, column="MIN(u.first_datetime)")
+    last = htcondor_db.epoch_seconds(conf=conf, column="MAX(u.last_datetime)")
+    return """SELECT j.id, j.username, j.groupname, j.exe, j.cpu, j.memory, SUM(u.samples) AS samples,
+              SUM(u.seconds) AS covered_seconds, SUM(u.cpu_load_sum) AS cpu_load_sum,
+              SUM(u.cpu_load_seconds) AS cpu_load_seconds, SUM(u.memory_usage_sum) AS memory_usage_sum,
+              SUM(u.memory_usage_seconds) AS memory_usage_seconds, MAX(u.memory_usage_max) AS memory_usage_max,
+              """ + last + " - " + first + """ AS seconds
+              FROM (SELECT id, datetime AS first_datetime, datetime AS last_datetime, 1 AS samples, seconds,
+                    cpu_load AS cpu_load_sum, cpu_load * seconds AS cpu_load_seconds,
+                    memory_usage AS memory_usage_sum, memory_usage * seconds AS memory_usage_seconds,
+                    memory_usage AS memory_usage_max FROM (""" + htcondor_db.sample_seconds_query(conf=conf) + """) w
+                    UNION ALL
+                    SELECT id, COALESCE(first_datetime, datetime), COALESCE(last_datetime, datetime), samples,
+                    seconds, cpu_load_avg * samples, cpu_load_avg * seconds, memory_usage_avg * samples,
+                    memory_usage_avg * seconds, memory_usage_max
+                    FROM job_stats_hourly WHERE datetime >= %s AND datetime < %s) u
+              JOIN jobs j ON j.id = u.id
+              GROUP BY j.id, j.username, j.groupname, j.exe, j.cpu, j.memory"""
+
+
+# Efficiency of one job
+###########################################
+def job_efficiency(row):
+    """
+    Compute the usage of one job from its aggregated samples.
+
+    The job's hours are the time between its first and last sample in the range, so a job with a single sample counts
+    as a job but adds no hours. Samples are stored unevenly in time, so means are weighted by the seconds each sample
+    covers until the job's next sample. Jobs whose samples cover no time use the plain mean of their samples.
+
+    :param row: dict
+    :return job: dict
+    """
+    hours = float(row["seconds"] or 0) / 3600
+    samples = float(row["samples"])
+    covered = float(row["covered_seconds"] or 0)
+    if covered > 0:
+        cpu_load = float(row["cpu_load_seconds"]) / covered
+        memory_usage = float(row["memory_usage_seconds"]) / covered
+    else:
+        cpu_load = float(row["cpu_load_sum"]) / samples
+        memory_usage = float(row["memory_usage_sum"]) / samples
+    peak_memory = float(row["memory_usage_max"])
+
+    job = {
+        "samples": samples,
+        "hours": hours,
+        # Core-hours requested and used
+        "core_hours": row["cpu"] * hours,
+        "load_hours": min(cpu_load, row["cpu"]) * hours,
+        # MiB-hours requested, used on average, and used at the peak
+        "memory_hours": row["memory"] * hours,
+        "memory_usage_hours": memory_usage * hours,
+        "peak_memory_hours": peak_memory * hours,
+        "peak_memory_ratio": peak_memory / row["memory"] if row["memory"] > 0 else 0
+    }
+    return job
+
+
+# Add a job to a report grouping
+###########################################
+def add_job(totals, key, job):
+    """
+    Add the usage of one job to the totals of its user, group, or executable.
+
+    :param totals: dict
+    :param key: str
+    :param job: dict
+    """
+    if key not in totals:
+        totals[key] = {"jobs": 0, "samples": 0, "core_hours": 0, "load_hours": 0, "memory_hours": 0,
+                       "memory_usage_hours": 0, "peak_memory_hours": 0, "max_peak_memory_ratio": 0,
+                       "memory_hours_wasted": 0}
+    total = totals[key]
+    total["jobs"] += 1
+    total["samples"] += job["samples"]
+    for column in ["core_hours", "load_hours", "memory_hours", "memory_usage_hours", "peak_memory_hours"]:
+        total[column] += job[column]
+    total["max_peak_memory_ratio"] = max(total["max_peak_memory_ratio"], job["peak_memory_ratio"])
+    # Memory that was requested but never used, even at the peak
+    total["memory_hours_wasted"] += max(job["memory_hours"] - job["peak_memory_hours"], 0)
+
+
+# Write a report
+###########################################
+def write_report(filename, label, totals):
+    """
+    Write the efficiency of each user, group, or executable, most core-hours wasted first.
+
+    :param filename: str
+    :param label: str
+    :param totals: dict
+    """
+    rows = []
+    for key, total in totals.items():
+        row = {
+            "jobs": total["jobs"],
+            "samples": int(total["samples"]),
+            "core_hours": total["core_hours"],
+            "cpu_efficiency": ratio(total["load_hours"], total["core_hours"]),
+            "core_hours_wasted": total["core_hours"] - total["load_hours"],
+            "memory_efficiency": ratio(total["memory_usage_hours"], total["memory_hours"]),
+            "peak_memory_efficiency": ratio(total["peak_memory_hours"], total["memory_hours"]),
+            "max_peak_memory_ratio": total["max_peak_memory_ratio"],
+            "memory_gib_hours_wasted": total["memory_hours_wasted"] / 1024
+        }
+        rows.append((str(key), row))
+    rows.sort(key=lambda item: item[1]["core_hours_wasted"], reverse=True)
+
+    out = open(filename, "w")
+    out.write(label + "\t" + "\t".join(REPORT_COLUMNS) + "\n")
+    for key, row in rows:
+        values = []
+        for column in REPORT_COLUMNS:
+            if isinstance(row[column], float):
+                values.append("{0:.2f}".format(row[column]))
+            else:
+                values.append(str(row[column]))
+        out.write(key + "\t" + "\t".join(values) + "\n")
+    out.close()
+
+
+# Safe ratio
+###########################################
+def ratio(numerator, denominator):
+    """
+    Divide, returning 0 when the denominator is 0.
+
+    :param numerator: float
+    :param denominator: float
+    :return ratio: float
+    """
+    if denominator == 0:
+        return 0.0
+    return float(numerator) / denominator
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+"""Tail HTCondor user/event logs and publish job events as they are written.
+
+Each log is read from a saved byte offset and only complete events (ending with the "..." separator line) are
+consumed, so an event that is still being written is read again on the next pass. Offsets can be kept in a JSON
+state file so a restarted reader continues where it stopped. Many logs are followed in one process by checking
+their size once per interval, no schedd queries are made.
+
+Events are dictionaries with the event code and name, the job ID, the event time, and the values parsed from the
+event body (host, memory usage, return value, ...). They can be passed to a callback with tail() or put on an
+asyncio queue with tail_async().
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+
+# Event codes
+EVENTS = {
+    0: "submit",
+    1: "execute",
+    2: "executable_error",
+    4: "evict",
+    5: "terminate",
+    6: "image_size",
+    7: "shadow_exception",
+    9: "abort",
+    12: "hold",
+    13: "release"
+}
+
+# Bytes read from a log at a time
+CHUNK_SIZE = 1024 * 1024
+
+# Events after which a job will not run again
+FINAL_EVENTS = ["terminate", "abort"]
+
+# Event header, for example "005 (123.000.000) 2024-01-02 03:04:05 Job terminated."
+# Older logs write the date without a year ("01/02 03:04:05")
+HEADER = re.compile(r"^(\d{3}) \((\d+)\.(\d+)\.(\d+)\) (\S+ \S+) (.*)$")
+
+# Event body patterns
+HOST = re.compile(r"<([^:>?]+)")
+SLOT = re.compile(r"SlotName: (\S+)")
+IMAGE_SIZE = re.compile(r"Image size of job updated: (\d+)")
+MEMORY_USAGE = re.compile(r"(\d+)\s+-\s+MemoryUsage of job")
+RESIDENT_SET_SIZE = re.compile(r"(\d+)\s+-\s+ResidentSetSize of job")
+RETURN_VALUE = re.compile(r"Normal termination \(return value (\d+)\)")
+SIGNAL = re.compile(r"Abnormal termination \(signal (\d+)\)")
+RUN_USAGE = re.compile(r"Usr (\d+) (\d+):(\d+):(\d+), Sys (\d+) (\d+):(\d+):(\d+)\s+-\s+Run Remote Usage")
+REASON = re.compile(r"^\s*Reason: (.*)$", re.MULTILINE)
+HOLD_CODE = re.compile(r"^\s*Code (\d+) Subcode (\d+)", re.MULTILINE)
+
+
+# Parse command-line options
+###########################################
+def options():
+    """Parse command-line options
+    """
+    parser = argparse.ArgumentParser(description="Print HTCondor user/event log events as JSON lines.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("logs", help="HTCondor user/event log files.", nargs="+")
+    parser.add_argument("-s", "--state", help="JSON file to keep the byte offset of each log in between runs.")
+    parser.add_argument("-f", "--follow", help="Keep following the logs for new events.", action="store_true")
+    parser.add_argument("-w", "--wait", help="Follow the logs until every submitted job has terminated or been "
+                                             "removed. The exit code is 1 if any job was removed or returned "
+                                             "non-zero.",
+                        action="store_true")
+    parser.add_argument("-i", "--interval", help="Seconds between checks for new events.", type=float, default=1)
+    parser.add_argument("-q", "--quiet", help="Do not print the events.", action="store_true")
+    args = parser.parse_args()
+
+    return args
+
+
+# Main
+###########################################
+def main():
+    """Main program.
+    """
+    args = options()
+
+    state = load_state(args.state)
+    # Jobs that have been submitted but have not finished, and whether every finished job succeeded
+    jobs = {"active": set(), "seen": False, "ok": True}
+
+    def publish(event):
+        if not args.quiet:
+            print(json.dumps(event))
+            sys.stdout.flush()
+        job_id = (event["cluster"], event["process"])
+        if event["type"] == "submit":
+            jobs["active"].add(job_id)
+            jobs["seen"] = True
+        elif event["type"] in FINAL_EVENTS:
+            jobs["active"].discard(job_id)
+            if event.get("return_value") != 0:
+                jobs["ok"] = False
+
+    def done():
+        # Stop once every job seen so far has finished, the logs may not exist until the jobs are submitted
+        return args.wait and jobs["seen"] and len(jobs["active"]) == 0
+
+    try:
+        if args.follow or args.wait:
+            tail(paths=args.logs, callback=publish, state=state, interval=args.interval, stop=done,
+                 state_file=args.state)
+        else:
+            read_all(paths=args.logs, callback=publish, state=state)
+    except KeyboardInterrupt:
+        pass
+    save_state(args.state, state)
+
+    if args.wait and not jobs["ok"]:
+        sys.exit(1)
+
+
+# Load saved offsets
+###########################################
+def load_state(filename):
+    """Load the saved offset of each log.
+
+    :param filename: str
+    :return state: dict
+    """
+    if filename is None or not os.path.exists(filename):
+        return {}
+    with open(filename, "r") as fh:
+        return json.load(fh)
+
+
+# Save offsets
+###########################################
+def save_state(filename, state):
+    """Save the offset of each log, replacing the state file atomically.
+
+    :param filename: str
+    :param state: dict
+    """
+    if filename is None:
+        return
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, filename)
+
+
+# Read the new events of every log once
+###########################################
+def read_all(paths, callback, state):
+    """Publish the events written to each log since its saved offset.
+
+    :param paths: list
+    :param callback: function
+    :param state: dict
+    :return count: int
+    """
+    count = 0
+    for path in paths:
+        for event in read_events(path=path, state=state):
+            callback(event)
+            count += 1
+    return count
+
+
+# Follow logs
+###########################################
+def tail(paths, callback, state=None, interval=1, stop=None, state_file=None):
+    """Follow the logs and publish each new event to callback.
+
+    :param paths: list
+    :param callback: function
+    :param state: dict
+    :param interval: float
+    :param stop: function
+    :param state_file: str
+    """
+    if state is None:
+        state = {}
+    while True:
+        if read_all(paths=paths, callback=callback, state=state) > 0:
+            save_state(state_file, state)
+        if stop is not None and stop():
+            return
+        time.sleep(interval)
+
+
+# Follow logs from an asyncio event loop
+###########################################
+async def tail_async(paths, queue, state=None, interval=1):
+    """Follow the logs and put each new event on an asyncio queue.
+
+    Logs are read in the default executor so a slow filesystem does not block the event loop.
+
+    :param paths: list
+    :param queue: asyncio.Queue
+    :param state: dict
+    :param interval: float
+    """
+    if state is None:
+        state = {}
+    loop = asyncio.get_running_loop()
+    while True:
+        for path in paths:
+            events = await loop.run_in_executor(None, lambda: list(read_events(path=path, state=state)))
+            for event in events:
+                await queue.put(event)
+        await asyncio.sleep(interval)
+
+
+# Read new events from one log
+###########################################
+def read_events(path, state, chunk_size=CHUNK_SIZE):
+    """Parse the complete events written to a log since its saved offset and advance the offset.
+
+    The log is read in chunks of chunk_size bytes, so only one chunk and the event it ends in are held in memory.
+    The offset restarts at 0 if the log was replaced (new inode) or truncated. A log that has not grown since the
+    last pass is not read again, even if it ends with an event that is still being written.
+
+    :param path: str
+    :param state: dict
+    :param chunk_size: int
+    :return events: generator
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        # The job may not have been submitted yet
+        return
+    saved = state.get(path, {"offset": 0, "inode": stat.st_ino})
+    offset = saved["offset"]
+    if saved["inode"] != stat.st_ino or stat.st_size < offset:
+        offset = 0
+    elif stat.st_size == saved.get("size", offset):
+        # Nothing was written since the last pass
+        return
+
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        # Bytes read after the last complete event
+        pending = b""
+        while True:
+            chunk = fh.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            pending += chunk
+            # Only consume complete events
+            end = pending.rfind(b"\n...\n")
+            if end == -1:
+                continue
+            complete = pending[:end + 5].split(b"\n...\n")[:-1]
+            pending = pending[end + 5:]
+            consumed = offset + end + 5
+
+            for text in complete:
+                event = parse_event(text.decode("utf-8", errors="replace"))
+                if event is not None:
+                    event["file"] = path
+                    yield event
+                # The offset only moves past an event once it has been handled, an event whose callback raised is
+                # read again
+                offset += len(text) + 5
+                state[path] = {"offset": offset, "inode": stat.st_ino, "size": offset}
+            offset = consumed
+            state[path] = {"offset": offset, "inode": stat.st_ino, "size": offset + len(pending)}
+        state[path] = {"offset": offset, "inode": stat.st_ino, "size": offset + len(pending)}
+
+
+# Parse one event
+###########################################
+def parse_event(text):
+    """Parse the text of one event, without the "..." separator.
+
+    :param text: str
+    :return event: dict
+    """
+    lines = text.strip("\n").split("\n")
+    # Skip anything before the header, such as a separator at the start of the chunk
+    while len(lines) > 0 and HEADER.match(lines[0]) is None:
+        lines.pop(0)
+    if len(lines) == 0:
+        return None
+    code, cluster, process, subprocess, timestamp, message = HEADER.match(lines[0]).groups()
+    body = "\n".join(lines)
+
+    event = {"code": int(code), "type": EVENTS.get(int(code), "other"), "cluster": int(cluster),
+             "process": int(process), "time": timestamp, "message": message}
+
+    if event["type"] in ["submit", "execute"]:
+        # Submit host or execute host
+        match = HOST.search(message)
+        if match is not None:
+            event["host"] = match.group(1)
+        match = SLOT.search(body)
+        if match is not None:
+            event["slot"] = match.group(1)
+    elif event["type"] == "image_size":
+        # Image size in KiB, memory usage in MiB, resident set size in KiB
+        event["image_size"] = int(IMAGE_SIZE.search(message).group(1))
+        match = MEMORY_USAGE.search(body)
+        if match is not None:
+            event["memory_usage"] = int(match.group(1))
+        match = RESIDENT_SET_SIZE.search(body)
+        if match is not None:
+            event["resident_set_size"] = int(match.group(1))
+    elif event["type"] == "terminate":
+        match = RETURN_VALUE.search(body)
+        if match is not None:
+            event["return_value"] = int(match.group(1))
+        match = SIGNAL.search(body)
+        if match is not None:
+            event["signal"] = int(match.group(1))
+        # CPU time in seconds
+        match = RUN_USAGE.search(body)
+        if match is not None:
+            usage = [int(value) for value in match.groups()]
+            event["remote_user_cpu"] = usage[0] * 86400 + usage[1] * 3600 + usage[2] * 60 + usage[3]
+            event["remote_sys_cpu"] = usage[4] * 86400 + usage[5] * 3600 + usage[6] * 60 + usage[7]
+    elif event["type"] in ["abort", "hold", "evict"]:
+        match = REASON.search(body)
+        if match is not None:
+            event["reason"] = match.group(1)
+        elif event["type"] in ["abort", "hold"] and len(lines) > 1:
+            # The hold reason or the condor_rm user is written on the first line after the header
+            event["reason"] = lines[1].strip()
+        match = HOLD_CODE.search(body)
+        if match is not None:
+            event["hold_code"] = int(match.group(1))
+            event["hold_subcode"] = int(match.group(2))
+
+    return event
+
+
+if __name__ == '__main__':
+    main()
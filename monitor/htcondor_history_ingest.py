@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+import os
+from subprocess import Popen, PIPE
+from datetime import datetime
+import argparse
+import json
+import sys
+import time
+import htcondor_db
+import htcondor_job_monitor
+
+
+# condor_history attributes
+HISTORY_ATTRS = ["ClusterId", "ProcId", "Owner", "LastRemoteHost", "RequestCpus", "RequestMemory", "MemoryUsage",
+                 "RequestDisk", "DiskUsage", "JobStartDate", "CompletionDate", "Cmd", "JobUniverse", "WantDocker",
+                 "ShouldTransferFiles", "AcctGroup", "GlobalJobId", "RemoteUserCpu", "RemoteSysCpu",
+                 "ExitCode"]
+
+# Columns written for each job
+JOB_COLUMNS = ["cluster", "process", "global_id", "username", "groupname", "start_date", "cpu", "memory", "disk",
+               "host", "universe", "exe", "transfer", "completion_date", "exit_code", "remote_user_cpu",
+               "remote_sys_cpu", "memory_usage", "disk_usage"]
+
+# Columns updated when the job was already recorded by the job monitor
+FINAL_COLUMNS = ["completion_date", "exit_code", "remote_user_cpu", "remote_sys_cpu", "memory_usage", "disk_usage"]
+
+
+# Parse command-line options
+###########################################
+def options():
+    """Parse command-line options
+    """
+    parser = argparse.ArgumentParser(description="Ingest finished HTCondor jobs from condor_history into the job "
+                                                 "statistics database.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-c", "--config", help="Database configuration JSON file (MySQL, or SQLite with "
+                                               "\"engine\": \"sqlite\").", required=True)
+    parser.add_argument("-n", "--name", help="Query the history of this schedd instead of the local schedd.")
+    parser.add_argument("--backfill-days", help="On the first run, only ingest jobs that completed in the last this "
+                                                "many days.", type=int, default=7)
+    parser.add_argument("-b", "--batch-size", help="Jobs written per database transaction.", type=int, default=1000)
+    args = parser.parse_args()
+
+    return args
+
+
+# Main
+###########################################
+def main():
+    """Main program.
+    """
+    # Parse arguments
+    args = options()
+
+    # Read the database connection configuration file
+    config = open(args.config, "r")
+    # Load the JSON configuration data
+    conf = json.load(config)
+    config.close()
+
+    db = htcondor_db.connect(conf=conf)
+    c = htcondor_db.cursor(db)
+
+    # The watermark is keyed by schedd name, the local schedd has no name
+    schedd = args.name or ""
+    watermark = read_watermark(c=c, schedd=schedd)
+
+    start = time.time()
+    cmd = history_command(watermark=watermark, name=args.name, backfill_days=args.backfill_days)
+    ps = Popen(cmd, stdout=PIPE, encoding="utf-8")
+    count, newest = ingest(conf=conf, db=db, c=c, records=parse_history(ps.stdout), batch_size=args.batch_size)
+    ps.stdout.close()
+    if ps.wait() != 0:
+        # Jobs already written are kept, they are upserted again on the next run
+        htcondor_job_monitor.log("condor_history failed with exit code {0}, watermark not updated".format(
+            ps.returncode))
+        sys.exit(1)
+
+    if newest is not None:
+        # Keep the old completion date if none of the new jobs completed normally
+        if newest["completion_date"] == 0 and watermark is not None:
+            newest["completion_date"] = watermark["completion_date"]
+        write_watermark(conf=conf, db=db, c=c, schedd=schedd, newest=newest)
+
+    htcondor_job_monitor.log("Ingested {0} jobs from condor_history in {1:.2f}s".format(count, time.time() - start))
+    c.close()
+    db.close()
+
+
+# Build the condor_history command
+###########################################
+def history_command(watermark, name=None, backfill_days=7):
+    """Build a condor_history command that only reads the records newer than the watermark.
+
+    condor_history reads the history newest first and -since stops the scan at the first record that matches, so only
+    the new part of the history is read. The scan stops at the newest job ingested last time, or at an older
+    completion date if that record has been rotated out of the history.
+
+    :param watermark: dict
+    :param name: str
+    :param backfill_days: int
+    :return cmd: list
+    """
+    if watermark is None:
+        since = "CompletionDate > 0 && CompletionDate < {0}".format(int(time.time()) - backfill_days * 86400)
+    else:
+        since = "GlobalJobId == \"{0}\" || (CompletionDate > 0 && CompletionDate < {1})".format(
+            watermark["global_id"], watermark["completion_date"])
+
+    cmd = ["condor_history"]
+    if name:
+        cmd.extend(["-name", name])
+    # Jobs that never started have no usage to record
+    cmd.extend(["-since", since, "-constraint", "JobStartDate =!= undefined", "-autoformat:t"])
+    cmd.extend(HISTORY_ATTRS)
+    return cmd
+
+
+# Read the watermark
+###########################################
+def read_watermark(c, schedd):
+    """Get the newest job ingested from the schedd.
+
+    :param c: database cursor
+    :param schedd: str
+    :return watermark: dict
+    """
+    c.execute("""SELECT global_id, completion_date FROM history_watermark WHERE schedd = %s""", [schedd])
+    return c.fetchone()
+
+
+# Store the watermark
+###########################################
+def write_watermark(conf, db, c, schedd, newest):
+    """Store the newest job ingested from the schedd.
+
+    :param conf: dict
+    :param db: database connection
+    :param c: database cursor
+    :param schedd: str
+    :param newest: dict
+    """
+    try:
+        c.execute("""INSERT INTO history_watermark (schedd, global_id, completion_date, updated) VALUES (%s, %s, %s,
+                  %s) """ + htcondor_db.upsert_clause(conf=conf, key="schedd",
+                                                      columns=["global_id", "completion_date", "updated"]),
+                  [schedd, newest["global_id"], newest["completion_date"],
+                   datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+# Process condor_history output
+###########################################
+def parse_history(lines):
+    """Build the final record of each job, one output line at a time.
+
+    :param lines: iterable
+    :return jobs: generator
+    """
+    # For each row in the output
+    for row in lines:
+        # Remove the newline if any
+        row = row.rstrip("\n")
+        # Split up the columns on tab characters
+        cols = row.split("\t")
+        # Ignore blank lines
+        if len(cols) < len(HISTORY_ATTRS):
+            continue
+        # Values that are undefined are stored as NULL
+        cols = [None if value == "undefined" else value for value in cols]
+
+        job = {}
+        # Cluster ID
+        job["cluster"] = int(cols[0])
+        # Process/Job ID
+        job["process"] = int(cols[1])
+        # Global Job ID
+        job["global_id"] = cols[16]
+        # Username
+        job["username"] = cols[2]
+        # Groupname
+        job["groupname"] = (cols[15] or "").replace("group_", "")
+        # Host of the last execution
+        job["host"] = (cols[3] or "").replace("slot1@", "")
+
+        # Requests
+        # CPUs requested
+        job["cpu"] = int(cols[4] or 0)
+        # Requested memory in MiB
+        job["memory"] = int(cols[5] or 0)
+        # Requested disk (usually scratch) in KiB
+        job["disk"] = int(cols[7] or 0)
+
+        # Final usage
+        # Peak memory usage in MiB
+        job["memory_usage"] = None if cols[6] is None else int(cols[6])
+        # Disk usage in KiB
+        job["disk_usage"] = None if cols[8] is None else int(cols[8])
+        # CPU time in seconds
+        job["remote_user_cpu"] = None if cols[17] is None else float(cols[17])
+        job["remote_sys_cpu"] = None if cols[18] is None else float(cols[18])
+        # Exit code, undefined for removed jobs and jobs killed by a signal
+        job["exit_code"] = None if cols[19] is None else int(cols[19])
+
+        # Runtime
+        # Job start date in epoch seconds
+        job["start_date"] = datetime.fromtimestamp(int(cols[9])).strftime("%Y-%m-%d %H:%M:%S")
+        # Completion date in epoch seconds, 0 for removed jobs
+        job["completion_epoch"] = int(cols[10] or 0)
+        job["completion_date"] = None
+        if job["completion_epoch"] > 0:
+            job["completion_date"] = datetime.fromtimestamp(job["completion_epoch"]).strftime("%Y-%m-%d %H:%M:%S")
+
+        # Get the command name, excluding path
+        job["exe"] = os.path.basename(cols[11] or "")
+        # Rename interactive jobs
+        if job["exe"] == "sleep":
+            job["exe"] = "(interactive)"
+
+        # Get the job universe
+        universe = int(cols[12] or 0)
+        if universe in htcondor_job_monitor.UNIVERSES:
+            # If this is not a Docker job, look up the universe
+            if cols[13] == "true":
+                job["universe"] = "docker"
+            else:
+                job["universe"] = htcondor_job_monitor.UNIVERSES[universe]
+        else:
+            job["universe"] = "unknown:" + str(universe)
+
+        # Does this job use file transfers?
+        if cols[14] == "YES":
+            job["transfer"] = 1
+        else:
+            job["transfer"] = 0
+
+        yield job
+
+
+# Store final job records
+###########################################
+def ingest(conf, db, c, records, batch_size=1000):
+    """Insert or update the final record of each job, batch_size jobs per transaction.
+
+    Jobs already recorded by the job monitor keep their row and only get their final usage updated.
+
+    :param conf: dict
+    :param db: database connection
+    :param c: database cursor
+    :param records: iterable
+    :param batch_size: int
+    :return count: int
+    :return newest: dict
+    """
+    query = ("INSERT INTO jobs (" + ", ".join(JOB_COLUMNS) + ") VALUES (" + ", ".join(["%s"] * len(JOB_COLUMNS)) +
+             ") " + htcondor_db.upsert_clause(conf=conf, key="global_id", columns=FINAL_COLUMNS))
+    count = 0
+    # The history is read newest first, the first job is the next watermark
+    newest = None
+    batch = []
+    for job in records:
+        if newest is None:
+            newest = {"global_id": job["global_id"], "completion_date": 0}
+        newest["completion_date"] = max(newest["completion_date"], job["completion_epoch"])
+        batch.append([job[column] for column in JOB_COLUMNS])
+        if len(batch) >= batch_size:
+            write_jobs(db=db, c=c, query=query, batch=batch)
+            count += len(batch)
+            batch = []
+    if len(batch) > 0:
+        write_jobs(db=db, c=c, query=query, batch=batch)
+        count += len(batch)
+
+    return count, newest
+
+
+# Write one batch of jobs
+###########################################
+def write_jobs(db, c, query, batch):
+    """Write a batch of jobs in one transaction.
+
+    :param db: database connection
+    :param c: database cursor
+    :param query: str
+    :param batch: list
+    """
+    try:
+        c.executemany(query, batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,34 @@
 #!/usr/bin/env python
 import os
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, CalledProcessError
 from datetime import datetime
 import argparse
-import MySQLdb
 import json
+import sys
+import time
+import htcondor_db
+
+
+# Job universe IDs
+UNIVERSES = {
+    1: "standard",
+    5: "vanilla",
+    7: "scheduler",
+    8: "MPI",
+    9: "grid",
+    10: "java",
+    11: "parallel",
+    12: "local",
+    13: "vm"
+}
+
+# condor_q parameters
+JOB_CMD = ["condor_q", "-allusers", "-autoformat:t", "ClusterId", "ProcId", "Owner", "RemoteHost", "RequestCpus",
+           "RequestMemory", "MemoryUsage", "RequestDisk", "DiskUsage", "JobStartDate", "ServerTime", "Cmd",
+           "JobUniverse", "WantDocker", "ShouldTransferFiles", "AcctGroup", "GlobalJobId"]
+
+# condor_status parameters
+MACHINE_CMD = ["condor_status", "-autoformat:t", "JobId", "LoadAvg"]
 
 
 # Parse command-line options
@@ -14,9 +38,29 @@ def options():
     """
     parser = argparse.ArgumentParser(description="HTCondor job statistics monitor.",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    parser.add_argument("-c", "--config", help="MySQL database configuration JSON file.", required=True)
+    parser.add_argument("-c", "--config", help="Database configuration JSON file (MySQL, or SQLite with "
+                                               "\"engine\": \"sqlite\").", required=True)
+    parser.add_argument("-d", "--daemon", help="Stay resident and poll every --interval seconds instead of polling "
+                                               "once.", action="store_true")
+    parser.add_argument("-i", "--interval", help="Seconds between polls in daemon mode.", type=float, default=60)
+    parser.add_argument("--max-backoff", help="Maximum seconds to wait between database reconnect attempts in daemon "
+                                              "mode.", type=float, default=300)
+    parser.add_argument("--cpu-threshold", help="Only store a new sample when the CPU load changes by more than this "
+                                                "much since the last stored sample.", type=float, default=0.25)
+    parser.add_argument("--memory-threshold", help="Only store a new sample when the memory usage (MiB) changes by "
+                                                   "more than this much since the last stored sample.", type=int,
+                        default=128)
+    parser.add_argument("--disk-threshold", help="Only store a new sample when the disk usage (KiB) changes by more "
+                                                 "than this much since the last stored sample.", type=int,
+                        default=1048576)
+    parser.add_argument("--max-gap", help="Always store a sample if the last stored sample is at least this many "
+                                          "seconds old. Use 0 to store every sample.", type=int, default=900)
     args = parser.parse_args()
 
+    # Dead-band compression settings
+    args.deadband = {"cpu_load": args.cpu_threshold, "memory_usage": args.memory_threshold,
+                     "disk_usage": args.disk_threshold, "max_gap": args.max_gap}
+
     return args
 
 
@@ -25,49 +69,156 @@ def options():
 def main():
     """Main program.
     """
-
     # Parse arguments
     args = options()
 
-    # Job universe IDs
-    uni = {
-        1: "standard",
-        5: "vanilla",
-        7: "scheduler",
-        8: "MPI",
-        9: "grid",
-        10: "java",
-        11: "parallel",
-        12: "local",
-        13: "vm"
-    }
-
     # Read the database connection configuration file
-    config = open(args.config, "rU")
+    config = open(args.config, "r")
     # Load the JSON configuration data
     conf = json.load(config)
+    config.close()
 
-    # Connect to the MySQL database
-    db = MySQLdb.connect(host=conf["hostname"], db=conf["database"], user=conf["username"], passwd=conf["password"])
+    if args.daemon:
+        try:
+            daemon(args=args, conf=conf)
+        except KeyboardInterrupt:
+            pass
+    else:
+        # Connect to the database
+        db = htcondor_db.connect(conf=conf)
+        poll(db=db, deadband=args.deadband)
+        db.close()
 
-    # Create a database cursor
-    c = db.cursor(MySQLdb.cursors.DictCursor)
 
-    # condor_q parameters
-    cmd = ["condor_q", "-allusers", "-autoformat:t", "ClusterId", "ProcId", "Owner", "RemoteHost", "RequestCpus",
-           "RequestMemory", "MemoryUsage", "RequestDisk", "DiskUsage", "JobStartDate", "ServerTime", "Cmd",
-           "JobUniverse", "WantDocker", "ShouldTransferFiles", "AcctGroup", "GlobalJobId"]
+# Poll the job queue once
+###########################################
+def poll(db, ids=None, last=None, deadband=None):
+    """Query the running jobs and store their statistics.
 
-    machine = ["condor_status", "-autoformat:t", "JobId", "LoadAvg"]
+    :param db: database connection
+    :param ids: dict
+    :param last: dict
+    :param deadband: dict
+    :return timing: dict
+    """
+    timing = {}
 
+    start = time.time()
     # Run condor_status to get load averages per job
-    loads = {}
-    ps = Popen(machine, stdout=PIPE)
-    stdout = ps.communicate()
+    ps = Popen(MACHINE_CMD, stdout=PIPE)
+    loads_raw = ps.communicate()[0].decode()
+    # A busy or restarting schedd/collector returns no or partial output, do not store it as the pool state
+    if ps.returncode != 0:
+        raise CalledProcessError(ps.returncode, MACHINE_CMD[0])
+
+    # Run condor_q
+    ps = Popen(JOB_CMD, stdout=PIPE)
+    jobs_raw = ps.communicate()[0].decode()
+    if ps.returncode != 0:
+        raise CalledProcessError(ps.returncode, JOB_CMD[0])
+    timing["query"] = time.time() - start
+
+    start = time.time()
+    loads = parse_loads(raw=loads_raw)
+    jobs = parse_jobs(raw=jobs_raw, loads=loads)
+    timing["parse"] = time.time() - start
+    timing["jobs"] = len(jobs)
+
+    # Store the job statistics
+    start = time.time()
+    # Create a database cursor
+    c = htcondor_db.cursor(db)
+    timing["stored"] = write_stats(db=db, c=c, jobs=jobs, ids=ids, last=last, deadband=deadband)
+    c.close()
+    timing["db"] = time.time() - start
+
+    return timing
+
+
+# Resident polling loop
+###########################################
+def daemon(args, conf):
+    """Poll every args.interval seconds over one database connection.
+
+    Polls are scheduled on a fixed grid from the start time so they do not drift. If a poll overruns the interval the
+    missed polls are skipped rather than run back to back. If the database connection is lost it is reopened, waiting
+    twice as long after each failed attempt up to args.max_backoff seconds. Any other error, such as a failed
+    condor_q or output that cannot be parsed, is logged and the poll is skipped.
+
+    :param args: argparse object
+    :param conf: dict
+    """
+    Error, OperationalError = htcondor_db.errors(conf)
+
+    db = None
+    # Map of global job ID to jobs.id and last stored sample of each running job, kept between polls
+    ids = {}
+    last = {}
+    backoff = 1
+    next_poll = time.time()
+
+    while True:
+        # (Re)connect to the database
+        if db is None:
+            try:
+                db = htcondor_db.connect(conf=conf)
+                backoff = 1
+            except Error as e:
+                log("Database connection failed, retrying in {0}s: {1}".format(backoff, e))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, args.max_backoff)
+                continue
+
+        try:
+            timing = poll(db=db, ids=ids, last=last, deadband=args.deadband)
+            log("Poll: {0} jobs, {1} samples stored, query {2:.2f}s, parse {3:.2f}s, db {4:.2f}s".format(
+                timing["jobs"], timing["stored"], timing["query"], timing["parse"], timing["db"]))
+        except OperationalError as e:
+            # Lost connection, reconnect before the next poll
+            log("Database error, reconnecting: {0}".format(e))
+            try:
+                db.close()
+            except Error:
+                pass
+            db = None
+        except Error as e:
+            # The poll was rolled back, try again at the next poll
+            log("Database error, poll skipped: {0}".format(e))
+        except Exception as e:
+            # condor_q/condor_status failures and output that cannot be parsed, try again at the next poll
+            log("Poll failed, poll skipped: {0}: {1}".format(type(e).__name__, e))
+
+        # Schedule the next poll on the fixed grid
+        next_poll += args.interval
+        now = time.time()
+        if now > next_poll:
+            # Skip the polls that were missed instead of running them late
+            skipped = int((now - next_poll) // args.interval) + 1
+            next_poll += skipped * args.interval
+            log("Behind the {0}s schedule, skipped {1} poll(s)".format(args.interval, skipped))
+        time.sleep(next_poll - now)
+
+
+# Log a message
+###########################################
+def log(message):
+    """Print a timestamped message to stderr.
+
+    :param message: str
+    """
+    print("{0} {1}".format(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), message), file=sys.stderr)
+    sys.stderr.flush()
+
+
+# Process condor_status output
+###########################################
+def parse_loads(raw):
+    """Collect the load average of each running job.
 
-    # Process condor_q output
-    raw = stdout[0]
-    raw = raw.decode()
+    :param raw: str
+    :return loads: dict
+    """
+    loads = {}
     table = raw.split("\n")
 
     # For each row in the output
@@ -81,14 +232,19 @@ def main():
             job_id = cols[0]
             loadave = cols[1]
             loads[job_id] = loadave
+    return loads
 
-    # Run condor_q
-    ps = Popen(cmd, stdout=PIPE)
-    stdout = ps.communicate()
 
-    # Process condor_q output
-    raw = stdout[0]
-    raw = raw.decode()
+# Process condor_q output
+###########################################
+def parse_jobs(raw, loads):
+    """Build the statistics of each running job.
+
+    :param raw: str
+    :param loads: dict
+    :return jobs: list
+    """
+    jobs = []
     # Split output into rows
     table = raw.split("\n")
 
@@ -142,6 +298,7 @@ def main():
             # Job start date in epoch seconds
             stats["start_date"] = datetime.fromtimestamp(int(cols[9])).strftime("%Y-%m-%d %H:%M:%S")
             # Current time in epoch seconds
+            stats["server_time"] = int(cols[10])
             stats["datetime"] = datetime.fromtimestamp(int(cols[10])).strftime("%Y-%m-%d %H:%M:%S")
 
             # Get the command name, excluding path
@@ -151,12 +308,12 @@ def main():
                 stats["exe"] = "(interactive)"
 
             # Get the job universe
-            if int(cols[12]) in uni:
+            if int(cols[12]) in UNIVERSES:
                 # If this is not a Docker job, look up the universe
                 if cols[13] == "true":
                     stats["universe"] = "docker"
                 else:
-                    stats["universe"] = uni[int(cols[12])]
+                    stats["universe"] = UNIVERSES[int(cols[12])]
             else:
                 stats["universe"] = "unknown:" + str(cols[12])
 
@@ -166,28 +323,170 @@ def main():
             else:
                 stats["transfer"] = 0
 
-            # Groupname
-            stats["groupname"] = cols[15].replace("group_", "")
-
-            # Is this job already in the database?
-            c.execute("""SELECT id FROM jobs WHERE global_id = %s""", [stats["global"]])
-            stats["id"] = c.fetchone()
-            # This is a new job
-            if stats["id"] is None:
-                c.execute(
-                    """INSERT INTO jobs (cluster, process, global_id, username, groupname, start_date, cpu, memory, disk, host,
-                    universe, exe, transfer) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                    [stats["cluster"], stats["process"], stats["global"], stats["username"], stats["groupname"], stats["start_date"],
-                     stats["cpu"], stats["memory"], stats["disk"], stats["host"], stats["universe"], stats["exe"],
-                     stats["transfer"]])
-                c.execute("""SELECT id FROM jobs WHERE global_id = %s""", [stats["global"]])
-                stats["id"] = c.fetchone()
-
-            # Insert the job statistics
-            c.execute(
-                """INSERT INTO job_stats (id, datetime, cpu_load, memory_usage, disk_usage) VALUES (%s, %s, %s,
-                %s, %s)""", [stats["id"]["id"], stats["datetime"], stats["cpu_load"], stats["memory_usage"],
-                             stats["disk_usage"]])
+            # Groupname, undefined for jobs without an accounting group
+            if cols[15] == 0:
+                stats["groupname"] = "None"
+            else:
+                stats["groupname"] = cols[15].replace("group_", "")
+
+            jobs.append(stats)
+    return jobs
+
+
+# Store job statistics
+###########################################
+def write_stats(db, c, jobs, ids=None, last=None, deadband=None):
+    """Insert new jobs and the current statistics of each job into the database in one transaction.
+
+    With dead-band compression a job's sample is only stored if its CPU load, memory usage, or disk usage moved by
+    more than the threshold since the last stored sample, or the last stored sample is at least max_gap seconds old.
+
+    :param db: database connection
+    :param c: database cursor
+    :param jobs: list
+    :param ids: dict
+    :param last: dict
+    :param deadband: dict
+    :return stored: int
+    """
+    # Map of global job ID to jobs.id, kept between polls by the caller
+    if ids is None:
+        ids = {}
+    # Last stored sample of each job by jobs.id, kept between polls by the caller
+    if last is None:
+        last = {}
+    # IDs found in this transaction, only cached once it is committed
+    found = {}
+    # Samples stored in this transaction
+    stored = {}
+
+    try:
+        # Look up all of the jobs that are not cached yet
+        lookup_job_ids(c=c, global_ids=[stats["global"] for stats in jobs if stats["global"] not in ids], ids=found)
+
+        # Insert the new jobs
+        new_jobs = {}
+        for stats in jobs:
+            if stats["global"] not in ids and stats["global"] not in found:
+                new_jobs[stats["global"]] = stats
+        if len(new_jobs) > 0:
+            c.executemany(
+                """INSERT INTO jobs (cluster, process, global_id, username, groupname, start_date, cpu, memory, disk, host,
+                universe, exe, transfer) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                [[stats["cluster"], stats["process"], stats["global"], stats["username"], stats["groupname"],
+                  stats["start_date"], stats["cpu"], stats["memory"], stats["disk"], stats["host"], stats["universe"],
+                  stats["exe"], stats["transfer"]] for stats in new_jobs.values()])
+            # Get the IDs assigned to the new jobs
+            lookup_job_ids(c=c, global_ids=list(new_jobs.keys()), ids=found)
+
+        # Job ID of each sample
+        for stats in jobs:
+            stats["id"] = ids.get(stats["global"], found.get(stats["global"]))
+
+        # Select the samples to store
+        if deadband is None:
+            samples = jobs
+        else:
+            # Jobs seen before this process started continue from their last stored sample
+            load_last_samples(c=c, job_ids=[stats["id"] for stats in jobs if stats["id"] not in last
+                                            and stats["global"] not in new_jobs], last=last)
+            samples = [stats for stats in jobs if changed(stats=stats, previous=last.get(stats["id"]),
+                                                          deadband=deadband)]
+
+        # Insert the job statistics
+        c.executemany(
+            """INSERT INTO job_stats (id, datetime, cpu_load, memory_usage, disk_usage) VALUES (%s, %s, %s,
+            %s, %s)""", [[stats["id"], stats["datetime"], stats["cpu_load"], stats["memory_usage"],
+                          stats["disk_usage"]] for stats in samples])
+        for stats in samples:
+            stored[stats["id"]] = {"time": stats["server_time"], "cpu_load": stats["cpu_load"],
+                                   "memory_usage": stats["memory_usage"], "disk_usage": stats["disk_usage"]}
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    ids.update(found)
+    last.update(stored)
+
+    # Forget jobs that are no longer running
+    running = set([stats["id"] for stats in jobs])
+    for job_id in list(last.keys()):
+        if job_id not in running:
+            del last[job_id]
+    running = set([stats["global"] for stats in jobs])
+    for global_id in list(ids.keys()):
+        if global_id not in running:
+            del ids[global_id]
+
+    return len(samples)
+
+
+# Dead-band test
+###########################################
+def changed(stats, previous, deadband):
+    """Decide whether a sample moved far enough from the last stored sample to be stored.
+
+    :param stats: dict
+    :param previous: dict
+    :param deadband: dict
+    :return store: bool
+    """
+    # First sample of the job
+    if previous is None:
+        return True
+    # Last stored sample is too old
+    if stats["server_time"] - previous["time"] >= deadband["max_gap"]:
+        return True
+    for key in ["cpu_load", "memory_usage", "disk_usage"]:
+        if abs(stats[key] - previous[key]) > deadband[key]:
+            return True
+    return False
+
+
+# Load the last stored sample of each job
+###########################################
+def load_last_samples(c, job_ids, last, batch_size=500):
+    """Add the last stored sample of each job to last.
+
+    :param c: database cursor
+    :param job_ids: list
+    :param last: dict
+    :param batch_size: int
+    """
+    for i in range(0, len(job_ids), batch_size):
+        batch = job_ids[i:i + batch_size]
+        c.execute("""SELECT s.id, s.datetime, s.cpu_load, s.memory_usage, s.disk_usage FROM job_stats s
+                  JOIN (SELECT id, MAX(datetime) AS datetime FROM job_stats WHERE id IN (""" +
+                  ", ".join(["%s"] * len(batch)) + """) GROUP BY id) m ON s.id = m.id AND s.datetime = m.datetime""",
+                  batch)
+        for row in c.fetchall():
+            sample_time = row["datetime"]
+            # SQLite returns the datetime as text
+            if not isinstance(sample_time, datetime):
+                sample_time = datetime.strptime(sample_time, "%Y-%m-%d %H:%M:%S")
+            last[row["id"]] = {"time": int(time.mktime(sample_time.timetuple())), "cpu_load": row["cpu_load"],
+                               "memory_usage": row["memory_usage"], "disk_usage": row["disk_usage"]}
+
+
+# Look up database IDs by global job ID
+###########################################
+def lookup_job_ids(c, global_ids, ids, batch_size=500):
+    """Add the jobs.id of each global job ID that is already in the database to ids.
+
+    Global job IDs are looked up with one query per batch_size IDs.
+
+    :param c: database cursor
+    :param global_ids: list
+    :param ids: dict
+    :param batch_size: int
+    """
+    for i in range(0, len(global_ids), batch_size):
+        batch = global_ids[i:i + batch_size]
+        c.execute("""SELECT id, global_id FROM jobs WHERE global_id IN (""" + ", ".join(["%s"] * len(batch)) + ")",
+                  batch)
+        for row in c.fetchall():
+            ids[row["global_id"]] = row["id"]
 
 
 if __name__ == '__main__':
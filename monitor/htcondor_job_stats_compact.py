@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+import htcondor_db
+
+
+# Rolled up job_stats columns
+ROLLUP_COLUMNS = ["id", "datetime", "samples", "first_datetime", "last_datetime", "seconds", "cpu_load_min",
+                  "cpu_load_max", "cpu_load_avg", "memory_usage_min", "memory_usage_max", "memory_usage_avg",
+                  "disk_usage_min", "disk_usage_max", "disk_usage_avg"]
+
+
+# Parse command-line options
+###########################################
+def options():
+    """Parse command-line options
+    """
+    parser = argparse.ArgumentParser(description="Compact old HTCondor job statistics samples into hourly and daily "
+                                                 "rollups.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-c", "--config", help="Database configuration JSON file (MySQL, or SQLite with "
+                                               "\"engine\": \"sqlite\").", required=True)
+    parser.add_argument("-d", "--days", help="Compact raw samples older than this many days.", type=int, default=30)
+    args = parser.parse_args()
+
+    return args
+
+
+# Main
+###########################################
+def main():
+    """Main program.
+    """
+    # Parse arguments
+    args = options()
+
+    # Read the database connection configuration file
+    config = open(args.config, "r")
+    # Load the JSON configuration data
+    conf = json.load(config)
+    config.close()
+
+    db = htcondor_db.connect(conf=conf)
+    c = htcondor_db.cursor(db)
+
+    # Compact whole days so an hour or day is never split between two runs
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=args.days)
+
+    # Find the oldest raw sample
+    c.execute("""SELECT MIN(datetime) AS datetime FROM job_stats WHERE datetime < %s""",
+              [cutoff.strftime("%Y-%m-%d %H:%M:%S")])
+    oldest = c.fetchone()["datetime"]
+    if oldest is None:
+        print("No samples older than {0}.".format(cutoff.strftime("%Y-%m-%d")), file=sys.stderr)
+        return
+    # SQLite returns the datetime as text
+    if not isinstance(oldest, datetime):
+        oldest = datetime.strptime(oldest, "%Y-%m-%d %H:%M:%S")
+
+    # Compact one day per transaction
+    day = oldest.replace(hour=0, minute=0, second=0, microsecond=0)
+    total = 0
+    while day < cutoff:
+        total += compact(conf=conf, db=db, c=c, start=day, end=day + timedelta(days=1))
+        day += timedelta(days=1)
+
+    print("Compacted {0} samples older than {1}.".format(total, cutoff.strftime("%Y-%m-%d")), file=sys.stderr)
+    c.close()
+    db.close()
+
+
+# Compact a range of samples
+###########################################
+def compact(conf, db, c, start, end):
+    """Fold the raw samples from start up to end into the hourly and daily rollup tables and delete them.
+
+    Rollups keep the first and last sample times so job run times survive compaction. Averages are weighted by the
+    seconds each sample covers, or are plain means if every sample covers 0 seconds (the last sample of a job).
+    Samples are compacted oldest first, so the next sample of a job is still in job_stats.
+
+    :param conf: dict
+    :param db: database connection
+    :param c: database cursor
+    :param start: datetime
+    :param end: datetime
+    :return samples: int
+    """
+    time_range = [start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")]
+
+    try:
+        for table, unit in [("job_stats_hourly", "hour"), ("job_stats_daily", "day")]:
+            bucket = htcondor_db.truncate_datetime(conf=conf, column="datetime", unit=unit)
+            c.execute("INSERT INTO " + table + " (" + ", ".join(ROLLUP_COLUMNS) + ") SELECT id, " + bucket +
+                      """, COUNT(*), MIN(datetime), MAX(datetime), SUM(seconds), MIN(cpu_load), MAX(cpu_load), """ +
+                      weighted_average("cpu_load") + ", MIN(memory_usage), MAX(memory_usage), " +
+                      weighted_average("memory_usage") + ", MIN(disk_usage), MAX(disk_usage), " +
+                      weighted_average("disk_usage") + " FROM (" + htcondor_db.sample_seconds_query(conf=conf) +
+                      ") w GROUP BY id, " + bucket, time_range)
+        c.execute("""DELETE FROM job_stats WHERE datetime >= %s AND datetime < %s""", time_range)
+        samples = c.rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return samples
+
+
+# Time-weighted average
+###########################################
+def weighted_average(column):
+    """Get an SQL expression that averages a sample column weighted by the seconds each sample covers.
+
+    :param column: str
+    :return expression: str
+    """
+    return "CASE WHEN SUM(seconds) > 0 THEN SUM({0} * seconds) / SUM(seconds) ELSE AVG({0}) END".format(column)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ CREATE TABLE IF NOT EXISTS `jobs` (
     `id` INT(9) UNSIGNED AUTO_INCREMENT NOT NULL,
     `cluster` INT(9) NOT NULL,
     `process` INT(9) NOT NULL,
+    `global_id` VARCHAR(128) NOT NULL,
     `username` VARCHAR(30) NOT NULL,
     `groupname` VARCHAR(30) NOT NULL,
     `start_date` TIMESTAMP NOT NULL,
@@ -17,12 +18,36 @@ CREATE TABLE IF NOT EXISTS `jobs` (
     `universe` VARCHAR(30) NOT NULL,
     `exe` VARCHAR(100) NOT NULL,
     `transfer` TINYINT(1) NOT NULL,
+    `completion_date` TIMESTAMP NULL DEFAULT NULL,
+    `exit_code` INT(4) DEFAULT NULL,
+    `remote_user_cpu` FLOAT DEFAULT NULL,
+    `remote_sys_cpu` FLOAT DEFAULT NULL,
+    `memory_usage` INT(6) DEFAULT NULL,
+    `disk_usage` INT(6) DEFAULT NULL,
     PRIMARY KEY (id)
 );
 -- Create indexes
 CREATE INDEX index_jobs ON jobs(cluster, process);
 CREATE INDEX index_users ON jobs(username);
 CREATE INDEX index_groups ON jobs(groupname);
+-- The monitor resolves each poll's jobs by global job ID
+-- Existing databases: ALTER TABLE jobs ADD UNIQUE INDEX index_global_id (global_id);
+CREATE UNIQUE INDEX index_global_id ON jobs(global_id);
+-- Final job records from condor_history are stored by htcondor_history_ingest.py
+-- Existing databases: ALTER TABLE jobs ADD COLUMN completion_date TIMESTAMP NULL DEFAULT NULL,
+--     ADD COLUMN exit_code INT(4) DEFAULT NULL, ADD COLUMN remote_user_cpu FLOAT DEFAULT NULL,
+--     ADD COLUMN remote_sys_cpu FLOAT DEFAULT NULL, ADD COLUMN memory_usage INT(6) DEFAULT NULL,
+--     ADD COLUMN disk_usage INT(6) DEFAULT NULL;
+
+-- history_watermark table
+-- Stores the newest condor_history record ingested from each schedd
+CREATE TABLE IF NOT EXISTS `history_watermark` (
+    `schedd` VARCHAR(128) NOT NULL,
+    `global_id` VARCHAR(128) NOT NULL,
+    `completion_date` INT(11) NOT NULL,
+    `updated` TIMESTAMP NOT NULL,
+    PRIMARY KEY (schedd)
+);
 
 -- units table
 -- Stores information about the computing resource units of jobs and machines
@@ -46,3 +71,58 @@ CREATE TABLE IF NOT EXISTS `job_stats` (
     `disk_usage` INT(6) NOT NULL,
     FOREIGN KEY (id) REFERENCES jobs(id)
 );
+-- The monitor looks up the last sample of each job and the compaction job scans by date
+CREATE INDEX index_job_stats ON job_stats(id, datetime);
+CREATE INDEX index_job_stats_datetime ON job_stats(datetime);
+
+-- job_stats_hourly table
+-- Stores hourly min/max/avg rollups of job_stats samples that have been compacted
+-- Averages are weighted by the seconds each sample covers, up to the job's next sample
+-- Existing databases: ALTER TABLE job_stats_hourly ADD COLUMN first_datetime TIMESTAMP NULL DEFAULT NULL,
+--     ADD COLUMN last_datetime TIMESTAMP NULL DEFAULT NULL, ADD COLUMN seconds FLOAT NOT NULL DEFAULT 0;
+CREATE TABLE IF NOT EXISTS `job_stats_hourly` (
+    `id` INT(9) UNSIGNED NOT NULL,
+    `datetime` TIMESTAMP NOT NULL,
+    `samples` INT(9) NOT NULL,
+    `first_datetime` TIMESTAMP NULL DEFAULT NULL,
+    `last_datetime` TIMESTAMP NULL DEFAULT NULL,
+    `seconds` FLOAT NOT NULL DEFAULT 0,
+    `cpu_load_min` FLOAT(5, 2) NOT NULL,
+    `cpu_load_max` FLOAT(5, 2) NOT NULL,
+    `cpu_load_avg` FLOAT(5, 2) NOT NULL,
+    `memory_usage_min` INT(6) NOT NULL,
+    `memory_usage_max` INT(6) NOT NULL,
+    `memory_usage_avg` FLOAT NOT NULL,
+    `disk_usage_min` INT(6) NOT NULL,
+    `disk_usage_max` INT(6) NOT NULL,
+    `disk_usage_avg` FLOAT NOT NULL,
+    PRIMARY KEY (id, datetime),
+    FOREIGN KEY (id) REFERENCES jobs(id)
+);
+CREATE INDEX index_job_stats_hourly_datetime ON job_stats_hourly(datetime);
+
+-- job_stats_daily table
+-- Stores daily min/max/avg rollups of job_stats samples that have been compacted
+-- Averages are weighted by the seconds each sample covers, up to the job's next sample
+-- Existing databases: ALTER TABLE job_stats_daily ADD COLUMN first_datetime TIMESTAMP NULL DEFAULT NULL,
+--     ADD COLUMN last_datetime TIMESTAMP NULL DEFAULT NULL, ADD COLUMN seconds FLOAT NOT NULL DEFAULT 0;
+CREATE TABLE IF NOT EXISTS `job_stats_daily` (
+    `id` INT(9) UNSIGNED NOT NULL,
+    `datetime` TIMESTAMP NOT NULL,
+    `samples` INT(9) NOT NULL,
+    `first_datetime` TIMESTAMP NULL DEFAULT NULL,
+    `last_datetime` TIMESTAMP NULL DEFAULT NULL,
+    `seconds` FLOAT NOT NULL DEFAULT 0,
+    `cpu_load_min` FLOAT(5, 2) NOT NULL,
+    `cpu_load_max` FLOAT(5, 2) NOT NULL,
+    `cpu_load_avg` FLOAT(5, 2) NOT NULL,
+    `memory_usage_min` INT(6) NOT NULL,
+    `memory_usage_max` INT(6) NOT NULL,
+    `memory_usage_avg` FLOAT NOT NULL,
+    `disk_usage_min` INT(6) NOT NULL,
+    `disk_usage_max` INT(6) NOT NULL,
+    `disk_usage_avg` FLOAT NOT NULL,
+    PRIMARY KEY (id, datetime),
+    FOREIGN KEY (id) REFERENCES jobs(id)
+);
+CREATE INDEX index_job_stats_daily_datetime ON job_stats_daily(datetime);
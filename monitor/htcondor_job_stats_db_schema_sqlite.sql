@@ -0,0 +1,114 @@
+-- SQLite version of htcondor_job_stats_db_schema.sql
+-- Use with "engine": "sqlite" in the database configuration file
+
+-- jobs table
+-- Stores job and machine Classad information about each HTCondor job
+CREATE TABLE IF NOT EXISTS `jobs` (
+    `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+    `cluster` INTEGER NOT NULL,
+    `process` INTEGER NOT NULL,
+    `global_id` TEXT NOT NULL,
+    `username` TEXT NOT NULL,
+    `groupname` TEXT NOT NULL,
+    `start_date` TEXT NOT NULL,
+    `cpu` INTEGER NOT NULL,
+    `cpu_unit` TEXT DEFAULT "count",
+    `memory` INTEGER NOT NULL,
+    `memory_unit` TEXT DEFAULT "MiB",
+    `disk` INTEGER NOT NULL,
+    `disk_unit` TEXT DEFAULT "KiB",
+    `host` TEXT NOT NULL,
+    `universe` TEXT NOT NULL,
+    `exe` TEXT NOT NULL,
+    `transfer` INTEGER NOT NULL,
+    `completion_date` TEXT DEFAULT NULL,
+    `exit_code` INTEGER DEFAULT NULL,
+    `remote_user_cpu` REAL DEFAULT NULL,
+    `remote_sys_cpu` REAL DEFAULT NULL,
+    `memory_usage` INTEGER DEFAULT NULL,
+    `disk_usage` INTEGER DEFAULT NULL
+);
+-- Create indexes
+CREATE INDEX IF NOT EXISTS index_jobs ON jobs(cluster, process);
+CREATE INDEX IF NOT EXISTS index_users ON jobs(username);
+CREATE INDEX IF NOT EXISTS index_groups ON jobs(groupname);
+CREATE UNIQUE INDEX IF NOT EXISTS index_global_id ON jobs(global_id);
+
+-- history_watermark table
+-- Stores the newest condor_history record ingested from each schedd
+CREATE TABLE IF NOT EXISTS `history_watermark` (
+    `schedd` TEXT NOT NULL PRIMARY KEY,
+    `global_id` TEXT NOT NULL,
+    `completion_date` INTEGER NOT NULL,
+    `updated` TEXT NOT NULL
+);
+
+-- units table
+-- Stores information about the computing resource units of jobs and machines
+CREATE TABLE IF NOT EXISTS `units` (
+    `unit_id` TEXT NOT NULL,
+    `unit_name` TEXT NOT NULL,
+    `url` TEXT NOT NULL
+);
+-- Insert default unit data into units
+INSERT INTO `units` (`unit_id`, `unit_name`, `url`) VALUES ("count", "count", "http://semanticscience.org/resource/SIO_000794.rdf");
+INSERT INTO `units` (`unit_id`, `unit_name`, `url`) VALUES ("MiB", "mebibyte", "http://purl.obolibrary.org/obo/UO_0000246");
+INSERT INTO `units` (`unit_id`, `unit_name`, `url`) VALUES ("KiB", "kibibyte", "http://purl.obolibrary.org/obo/UO_0000245");
+
+-- job_stats table
+-- Stores a jobs current usage statistics
+CREATE TABLE IF NOT EXISTS `job_stats` (
+    `id` INTEGER NOT NULL REFERENCES jobs(id),
+    `datetime` TEXT NOT NULL,
+    `cpu_load` REAL NOT NULL,
+    `memory_usage` INTEGER NOT NULL,
+    `disk_usage` INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS index_job_stats ON job_stats(id, datetime);
+CREATE INDEX IF NOT EXISTS index_job_stats_datetime ON job_stats(datetime);
+
+-- job_stats_hourly table
+-- Stores hourly min/max/avg rollups of job_stats samples that have been compacted
+-- Averages are weighted by the seconds each sample covers, up to the job's next sample
+CREATE TABLE IF NOT EXISTS `job_stats_hourly` (
+    `id` INTEGER NOT NULL REFERENCES jobs(id),
+    `datetime` TEXT NOT NULL,
+    `samples` INTEGER NOT NULL,
+    `first_datetime` TEXT,
+    `last_datetime` TEXT,
+    `seconds` REAL NOT NULL DEFAULT 0,
+    `cpu_load_min` REAL NOT NULL,
+    `cpu_load_max` REAL NOT NULL,
+    `cpu_load_avg` REAL NOT NULL,
+    `memory_usage_min` INTEGER NOT NULL,
+    `memory_usage_max` INTEGER NOT NULL,
+    `memory_usage_avg` REAL NOT NULL,
+    `disk_usage_min` INTEGER NOT NULL,
+    `disk_usage_max` INTEGER NOT NULL,
+    `disk_usage_avg` REAL NOT NULL,
+    PRIMARY KEY (id, datetime)
+);
+CREATE INDEX IF NOT EXISTS index_job_stats_hourly_datetime ON job_stats_hourly(datetime);
+
+-- job_stats_daily table
+-- Stores daily min/max/avg rollups of job_stats samples that have been compacted
+-- Averages are weighted by the seconds each sample covers, up to the job's next sample
+CREATE TABLE IF NOT EXISTS `job_stats_daily` (
+    `id` INTEGER NOT NULL REFERENCES jobs(id),
+    `datetime` TEXT NOT NULL,
+    `samples` INTEGER NOT NULL,
+    `first_datetime` TEXT,
+    `last_datetime` TEXT,
+    `seconds` REAL NOT NULL DEFAULT 0,
+    `cpu_load_min` REAL NOT NULL,
+    `cpu_load_max` REAL NOT NULL,
+    `cpu_load_avg` REAL NOT NULL,
+    `memory_usage_min` INTEGER NOT NULL,
+    `memory_usage_max` INTEGER NOT NULL,
+    `memory_usage_avg` REAL NOT NULL,
+    `disk_usage_min` INTEGER NOT NULL,
+    `disk_usage_max` INTEGER NOT NULL,
+    `disk_usage_avg` REAL NOT NULL,
+    PRIMARY KEY (id, datetime)
+);
+CREATE INDEX IF NOT EXISTS index_job_stats_daily_datetime ON job_stats_daily(datetime);
@@ -2,6 +2,7 @@
 import argparse
 import sqlite3 as sq
 import datetime
+from bisect import bisect_left
 
 
 # Parse command-line arguments
@@ -22,10 +23,20 @@ def options():
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-d", "--db", help="SQLite database filename.", required=True)
     parser.add_argument("-o", "--outfile", help="Report output prefix.", required=True)
-    parser.add_argument("-s", "--start", help="Report start date (YYYY-mm-dd).", required=True)
-    parser.add_argument("-e", "--end", help="Report end date (YYYY-mm-dd).", required=True)
+    parser.add_argument("-s", "--start", help="Report start date (YYYY-mm-dd).")
+    parser.add_argument("-e", "--end", help="Report end date (YYYY-mm-dd).")
+    parser.add_argument("-m", "--monthly", help="Write one report per month for a range of months (YYYY-mm..YYYY-mm). "
+                                                "Each report prefix gets the month appended.")
     args = parser.parse_args()
 
+    # Report periods as (output prefix, start date, end date)
+    if args.monthly:
+        args.periods = monthly_periods(prefix=args.outfile, months=args.monthly)
+    elif args.start and args.end:
+        args.periods = [(args.outfile, args.start, args.end)]
+    else:
+        parser.error("either --start and --end or --monthly is required")
+
     return args
 
 
@@ -37,6 +48,10 @@ def options():
 def main():
     """Main program.
 
+    The usage of a period is measured between the last snapshots taken at or before midnight at the start of the
+    period's start and end dates. Periods covered by the interval usage tables are summed from them, older periods
+    are the difference between the two snapshots.
+
     Args:
 
     Returns:
@@ -59,42 +74,36 @@ def main():
     # Database handler
     db = connect.cursor()
 
-    # Get list of groups
-    groups = []
-    for row in db.execute('SELECT DISTINCT(`group`) FROM `group_stats`'):
-        groups.append(row['group'])
-
-    # Generate report for group usage
-    out = open(args.outfile + "_group_stats.txt", "w")
-    out.write("Group\tUsage\n")
-    for group in groups:
-        start_usage = get_group_usage(group, args.start, db)
-        end_usage = get_group_usage(group, args.end, db)
-        month_usage = end_usage - start_usage
-        month_usage /= 60
-        month_usage /= 60
-        out.write(group + "\t" + str(month_usage) + "\n")
-    out.close()
-
-    # Generate user reports for each group
-    for group in groups:
-        out = open(args.outfile + "_" + group + "_stats.txt", "w")
-        out.write("User\tUsage\n")
-
-        # Get users for group
-        users = []
-        terms = (group,)
-        for row in db.execute('SELECT DISTINCT(`user`) FROM `user_stats` WHERE `group` = ?', terms):
-            users.append(row['user'])
-
-        # Generate report for users in the group
-        for user in users:
-            start_usage = get_user_usage(group, user, args.start, db)
-            end_usage = get_user_usage(group, user, args.end, db)
-            month_usage = end_usage - start_usage
+    boundaries = sorted(set([start for _, start, _ in args.periods] + [end for _, _, end in args.periods]))
+    group_usage = period_usage(db=db, periods=args.periods, boundaries=boundaries, snapshots="group_stats",
+                               intervals="group_interval_usage", keys=["group"])
+    user_usage = period_usage(db=db, periods=args.periods, boundaries=boundaries, snapshots="user_stats",
+                              intervals="user_interval_usage", keys=["group", "user"])
+
+    for prefix, _, _ in args.periods:
+        groups = group_usage[prefix]
+        # Generate report for group usage
+        out = open(prefix + "_group_stats.txt", "w")
+        out.write("Group\tUsage\n")
+        for (group,) in sorted(groups.keys()):
+            month_usage = groups[(group,)]
             month_usage /= 60
             month_usage /= 60
-            out.write(user + "\t" + str(month_usage) + "\n")
+            out.write(group + "\t" + str(month_usage) + "\n")
+        out.close()
+
+        # Generate user reports for each group
+        users = user_usage[prefix]
+        for (group,) in sorted(groups.keys()):
+            out = open(prefix + "_" + group + "_stats.txt", "w")
+            out.write("User\tUsage\n")
+            for user_group, user in sorted(users.keys()):
+                if user_group == group:
+                    month_usage = users[(user_group, user)]
+                    month_usage /= 60
+                    month_usage /= 60
+                    out.write(user + "\t" + str(month_usage) + "\n")
+            out.close()
 
     db.close()
     connect.close()
@@ -102,6 +111,28 @@ def main():
 ###########################################
 
 
+# Monthly report periods
+###########################################
+def monthly_periods(prefix, months):
+    """
+    Build one report period per month of a YYYY-mm..YYYY-mm range.
+
+    :param prefix: str
+    :param months: str
+    :return periods: list
+    """
+    first, last = months.split("..")
+    year, month = [int(value) for value in first.split("-")]
+    last_year, last_month = [int(value) for value in last.split("-")]
+    periods = []
+    while (year, month) <= (last_year, last_month):
+        start = datetime.date(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        end = datetime.date(year, month, 1)
+        periods.append((prefix + "_" + start.strftime("%Y-%m"), start.isoformat(), end.isoformat()))
+    return periods
+
+
 # Dictionary factory for SQLite query results
 ###########################################
 def dict_factory(cursor, row):
@@ -122,41 +153,125 @@ def dict_factory(cursor, row):
     return d
 
 
-# Query group-level statistics
+# Query usage for every period
 ###########################################
-def get_group_usage(group, date, db):
+def period_usage(db, periods, boundaries, snapshots, intervals, keys):
     """
-    Query the database for group usage on a specific date.
+    Query the usage of each group or user in every period.
+
+    :param db: object
+    :param periods: list
+    :param boundaries: list
+    :param snapshots: str
+    :param intervals: str
+    :param keys: list
+    :return usage: dict
+    """
+    # Snapshot used for each boundary date
+    snapshot_times = {}
+    for boundary in boundaries:
+        snapshot_times[boundary] = get_snapshot_time(boundary, snapshots, db)
+    times = sorted(set([value for value in snapshot_times.values() if value is not None]))
+
+    # The interval tables only cover the time since the logger started writing them, databases that predate them only
+    # have snapshots
+    covered = None
+    db.execute("SELECT `name` FROM `sqlite_master` WHERE `type` = 'table' AND `name` = ?", (intervals,))
+    if db.fetchone() is not None:
+        db.execute('SELECT MIN(`start`) AS `start` FROM `' + intervals + '`')
+        covered = db.fetchone()['start']
+
+    # Usage of every snapshot or interval period in one query each
+    snapshot_usage = {}
+    interval_usage = {}
+    if covered is not None and len(times) > 0 and covered <= times[-1]:
+        interval_usage = get_interval_usage(times, intervals, keys, db)
+    if covered is None or len(times) == 0 or covered > times[0]:
+        snapshot_usage = get_snapshot_usage(times, snapshots, keys, db)
+
+    usage = {}
+    for prefix, start, end in periods:
+        usage[prefix] = {}
+        start_time = snapshot_times[start]
+        end_time = snapshot_times[end]
+        if start_time is None or end_time is None or start_time == end_time:
+            continue
+        if covered is not None and covered <= start_time:
+            # Add up the intervals between the two snapshots
+            for i in range(times.index(start_time) + 1, times.index(end_time) + 1):
+                for key, value in interval_usage.get(times[i], {}).items():
+                    usage[prefix][key] = usage[prefix].get(key, 0) + value
+        else:
+            # Accumulated usage at the end minus the accumulated usage at the start
+            start_usage = snapshot_usage.get(start_time, {})
+            for key, value in snapshot_usage.get(end_time, {}).items():
+                usage[prefix][key] = value - start_usage.get(key, 0)
+    return usage
+
+
+# Query the snapshot used for a date
+###########################################
+def get_snapshot_time(date, table, db):
+    """
+    Query the database for the last snapshot taken at or before the start of a date.
 
-    :param group: str
     :param date: str
+    :param table: str
     :param db: object
-    :return usage: int
+    :return datetime: str
     """
-    terms = (group, date + '%',)
-    db.execute('SELECT * FROM `group_stats` WHERE `group` = ? AND `datetime` LIKE ?', terms)
-    result = db.fetchone()
-    return int(result['usage'])
+    terms = (date + ' 00:00:00',)
+    db.execute('SELECT MAX(`datetime`) AS `datetime` FROM `' + table + '` WHERE `datetime` <= ?', terms)
+    return db.fetchone()['datetime']
 
 
-# Query group-level statistics
+# Query snapshot usage
 ###########################################
-def get_user_usage(group, user, date, db):
+def get_snapshot_usage(times, table, keys, db):
     """
-    Query the database for group usage on a specific date.
+    Query the database for the accumulated usage of each group or user in several snapshots.
 
-    :param group: str
-    :param date: str
+    :param times: list
+    :param table: str
+    :param keys: list
     :param db: object
-    :return usage: int
+    :return usage: dict
+    """
+    columns = ', '.join(['`' + key + '`' for key in keys])
+    db.execute('SELECT `datetime`, ' + columns + ', SUM(`usage`) AS `usage` FROM `' + table + '` WHERE `datetime` '
+               'IN (' + ', '.join(['?'] * len(times)) + ') GROUP BY `datetime`, ' + columns, times)
+    usage = {}
+    for row in db:
+        usage.setdefault(row['datetime'], {})[tuple([row[key] for key in keys])] = row['usage']
+    return usage
+
+
+# Query interval usage
+###########################################
+def get_interval_usage(times, table, keys, db):
     """
-    terms = (group, user, date + '%',)
-    db.execute('SELECT * FROM `user_stats` WHERE `group` = ? AND `user` = ? AND `datetime` LIKE ?', terms)
-    usage = 0
-    for result in db:
-        if result is not None:
-            usage += result['usage']
-    return int(usage)
+    Query the database for the usage of each group or user between consecutive snapshots.
+
+    Intervals are assigned to the first snapshot at or after their end.
+
+    :param times: list
+    :param table: str
+    :param keys: list
+    :param db: object
+    :return usage: dict
+    """
+    columns = ', '.join(['`' + key + '`' for key in keys])
+    terms = (times[0], times[-1],)
+    db.execute('SELECT `end`, ' + columns + ', SUM(`usage`) AS `usage` FROM `' + table + '` WHERE `end` > ? AND '
+               '`end` <= ? GROUP BY `end`, ' + columns, terms)
+    usage = {}
+    for row in db:
+        period_end = times[bisect_left(times, row['end'])]
+        key = tuple([row[key] for key in keys])
+        usage.setdefault(period_end, {})
+        usage[period_end][key] = usage[period_end].get(key, 0) + row['usage']
+    return usage
+
 
 if __name__ == '__main__':
     main()
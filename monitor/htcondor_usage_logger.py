@@ -5,6 +5,10 @@ import datetime
 from subprocess import Popen, PIPE
 
 
+# UID domains stripped from condor_userprio submitter names
+DOMAINS = ["ddpsc.org", "datasci.danforthcenter.org"]
+
+
 # Parse command-line arguments
 ###########################################
 def options():
@@ -24,9 +28,12 @@ def options():
     parser = argparse.ArgumentParser(description='HTCondor user/group usage logger.',
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-d", "--db", help="SQLite database filename.", required=True)
+    parser.add_argument("-m", "--domains", help="One or more (comma-separated) UID domains to strip from user names. "
+                                                "Use * to strip any domain.", default=",".join(DOMAINS))
     args = parser.parse_args()
 
     args.date = date
+    args.domains = args.domains.split(",")
 
     return args
 
@@ -50,13 +57,36 @@ def main():
     # Get options
     args = options()
 
+    ps = Popen(['condor_userprio', "-allusers", "-autoformat:r", "Name", "WeightedAccumulatedUsage"], stdout=PIPE,
+               encoding="utf-8")
+    stdout = ps.communicate()
+
+    users, groups = parse_usage(report=stdout[0], domains=args.domains)
+
     connect = sq.connect(args.db)
-    db = connect.cursor()
+    write_usage(connect=connect, date=args.date, users=users, groups=groups)
+    connect.close()
+###########################################
 
-    ps = Popen(['condor_userprio', "-allusers", "-autoformat:r", "Name", "WeightedAccumulatedUsage"], stdout=PIPE)
-    stdout = ps.communicate()
 
-    report = stdout[0]
+# Process condor_userprio output
+###########################################
+def parse_usage(report, domains=None):
+    """Split the condor_userprio report into user and group usage.
+
+    Args:
+        report: (str) condor_userprio -autoformat:r output.
+        domains: (list) UID domains to strip from user names, "*" strips any domain.
+    Returns:
+        users: (list) (user, group, usage) tuples.
+        groups: (list) (group, usage) tuples.
+    Raises:
+
+    """
+    if domains is None:
+        domains = DOMAINS
+    users = []
+    groups = []
     usage_report = report.split('\n')
 
     for row in usage_report:
@@ -68,19 +98,20 @@ def main():
                 identity, usage = row.split(" ")
                 # Remove quotes
                 identity = identity.replace('"', "")
-                # Remove the user domain
-                group_user = identity.replace("@ddpsc.org", "")
-                group_user = group_user.replace("@datasci.danforthcenter.org", "")
+                # Remove the user domain, users from other domains keep it so they stay distinct
+                group_user, domain = identity.rsplit("@", 1)
                 # Remove "nice-user"
                 group_user = group_user.replace("nice-user.", "")
                 group, user = "None", "None"
                 if "." in group_user:
-                    # The user specified their accounting group
-                    group, user = group_user.split(".")
+                    # The user specified their accounting group, which may be a subgroup (group_a.sub)
+                    group, user = group_user.rsplit(".", 1)
                 else:
                     user = group_user
+                if "*" not in domains and domain not in domains:
+                    user += "@" + domain
                 # print("Date: " + args.date + ", User: " + user + ", Group: " + group + ', Usage: ' + usage)
-                db.execute("INSERT INTO user_stats VALUES (?, ?, ?, ?)", (args.date, user, group, usage))
+                users.append((user, group, usage))
             elif "group" in row:
                 # Then this is a group total row
                 # Remove quotes
@@ -88,11 +119,151 @@ def main():
                 # Split the group and usage
                 group, usage = row.split(" ")
                 # print("Date: " + args.date + ", Group: " + group + ", Usage: " + usage)
-                db.execute("INSERT INTO group_stats VALUES (?, ?, ?)", (args.date, group, usage))
+                groups.append((group, usage))
+
+    return users, groups
+
 
-    connect.commit()
+# Store usage snapshot
+###########################################
+def write_usage(connect, date, users, groups):
+    """Insert a usage snapshot and the usage accumulated since the previous snapshot into the database.
+
+    The snapshot, the user interval usage, and the group interval usage are written in one transaction. Nothing is
+    written to the interval tables for the first snapshot. The interval tables are created if the database predates
+    them.
+
+    Args:
+        connect: (object) sqlite3 database connection.
+        date: (str) snapshot datetime.
+        users: (list) (user, group, usage) tuples.
+        groups: (list) (group, usage) tuples.
+    Returns:
+
+    Raises:
+
+    """
+    db = connect.cursor()
+
+    try:
+        create_interval_tables(db=db)
+
+        # Previous snapshot, read before the new one is inserted
+        prev_date, prev_users = previous_snapshot(db=db, table="user_stats", keys=["user", "group"])
+        _, prev_groups = previous_snapshot(db=db, table="group_stats", keys=["group"])
+
+        db.executemany("INSERT INTO user_stats VALUES (?, ?, ?, ?)",
+                       [(date, user, group, usage) for user, group, usage in users])
+        db.executemany("INSERT INTO group_stats VALUES (?, ?, ?)", [(date, group, usage) for group, usage in groups])
+
+        if prev_date is not None:
+            user_usage = interval_usage(current=snapshot_totals([((user, group), usage)
+                                                                 for user, group, usage in users]),
+                                        previous=prev_users)
+            db.executemany("INSERT INTO user_interval_usage VALUES (?, ?, ?, ?, ?)",
+                           [(prev_date, date, user, group, usage) for (user, group), usage in user_usage])
+            group_usage = interval_usage(current=snapshot_totals([((group,), usage) for group, usage in groups]),
+                                         previous=prev_groups)
+            db.executemany("INSERT INTO group_interval_usage VALUES (?, ?, ?, ?)",
+                           [(prev_date, date, group, usage) for (group,), usage in group_usage])
+
+        connect.commit()
+    except Exception:
+        connect.rollback()
+        raise
     db.close()
-    connect.close()
+
+
+# Create the interval usage tables
+###########################################
+def create_interval_tables(db):
+    """Create the interval usage tables and their indexes if they do not exist (same as monthly_report_db_schema.sql).
+
+    Args:
+        db: (object) sqlite3 database cursor.
+    Returns:
+
+    Raises:
+
+    """
+    db.execute("CREATE TABLE IF NOT EXISTS `user_interval_usage` (`start` TEXT NOT NULL, `end` TEXT NOT NULL, "
+               "`user` TEXT NOT NULL, `group` TEXT NOT NULL, `usage` REAL NOT NULL)")
+    db.execute("CREATE TABLE IF NOT EXISTS `group_interval_usage` (`start` TEXT NOT NULL, `end` TEXT NOT NULL, "
+               "`group` TEXT NOT NULL, `usage` REAL NOT NULL)")
+    db.execute("CREATE INDEX IF NOT EXISTS `user_interval_end` ON `user_interval_usage` (`end`)")
+    db.execute("CREATE INDEX IF NOT EXISTS `user_interval_group_user` ON `user_interval_usage` (`group`, `user`, "
+               "`end`)")
+    db.execute("CREATE INDEX IF NOT EXISTS `group_interval_end` ON `group_interval_usage` (`end`)")
+
+
+# Query the previous snapshot
+###########################################
+def previous_snapshot(db, table, keys):
+    """Get the accumulated usage of each user or group in the latest snapshot.
+
+    Args:
+        db: (object) sqlite3 database cursor.
+        table: (str) user_stats or group_stats.
+        keys: (list) columns that identify a user or group.
+    Returns:
+        date: (str) snapshot datetime, None if there is no snapshot.
+        usage: (dict) accumulated usage keyed by tuples of the key columns.
+    Raises:
+
+    """
+    columns = ", ".join(["`" + key + "`" for key in keys])
+    db.execute("SELECT " + columns + ", `usage`, `datetime` FROM `" + table + "` WHERE `datetime` = "
+               "(SELECT MAX(`datetime`) FROM `" + table + "`)")
+    rows = db.fetchall()
+    if len(rows) == 0:
+        return None, {}
+    return rows[0][-1], snapshot_totals([(tuple(row[:-2]), row[-2]) for row in rows])
+
+
+# Total the usage of each user or group
+###########################################
+def snapshot_totals(rows):
+    """Add up the usage of each user or group, a user can be listed more than once (nice-user).
+
+    Args:
+        rows: (list) (key, usage) tuples.
+    Returns:
+        usage: (dict) accumulated usage keyed by key.
+    Raises:
+
+    """
+    totals = {}
+    for key, usage in rows:
+        totals[key] = totals.get(key, 0) + float(usage)
+    return totals
+
+
+# Usage between two snapshots
+###########################################
+def interval_usage(current, previous):
+    """Compute the usage of each user or group since the previous snapshot.
+
+    The negotiator resets the accumulated usage of a user when it is reset with condor_userprio or when an inactive
+    user is forgotten. If the usage went down, or the user is new, all of the current usage was accumulated since
+    the reset, so it is counted as the interval usage. Users with no new usage are left out.
+
+    Args:
+        current: (dict) accumulated usage keyed by user or group.
+        previous: (dict) accumulated usage keyed by user or group.
+    Returns:
+        usage: (list) (key, usage) tuples.
+    Raises:
+
+    """
+    usage = []
+    for key, total in current.items():
+        delta = total - previous.get(key, 0)
+        if delta < 0:
+            # Usage was reset since the previous snapshot
+            delta = total
+        if delta > 0:
+            usage.append((key, delta))
+    return usage
 ###########################################
 
 
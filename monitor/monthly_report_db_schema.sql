@@ -14,3 +14,28 @@ CREATE TABLE IF NOT EXISTS `user_stats` (
 CREATE INDEX IF NOT EXISTS `group_datetime` ON `group_stats` (`datetime`);
 CREATE INDEX IF NOT EXISTS `group` ON `group_stats` (`group`);
 CREATE INDEX IF NOT EXISTS `user_datetime` ON `user_stats` (`datetime`);
+
+-- Usage accumulated by each user and group between consecutive snapshots, written by htcondor_usage_logger.py
+-- (which also creates these tables and indexes in databases that predate them)
+CREATE TABLE IF NOT EXISTS `user_interval_usage` (
+  `start` TEXT NOT NULL,
+  `end` TEXT NOT NULL,
+  `user` TEXT NOT NULL,
+  `group` TEXT NOT NULL,
+  `usage` REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS `group_interval_usage` (
+  `start` TEXT NOT NULL,
+  `end` TEXT NOT NULL,
+  `group` TEXT NOT NULL,
+  `usage` REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS `user_interval_end` ON `user_interval_usage` (`end`);
+CREATE INDEX IF NOT EXISTS `user_interval_group_user` ON `user_interval_usage` (`group`, `user`, `end`);
+CREATE INDEX IF NOT EXISTS `group_interval_end` ON `group_interval_usage` (`end`);
+
+-- Per group and per user lookups over a date range
+CREATE INDEX IF NOT EXISTS `group_group_datetime` ON `group_stats` (`group`, `datetime`);
+CREATE INDEX IF NOT EXISTS `user_group_user_datetime` ON `user_stats` (`group`, `user`, `datetime`);
@@ -5,6 +5,40 @@ from subprocess import Popen, PIPE
 import argparse
 
 
+# Job universe IDs
+UNIVERSES = {
+    "1": "standard",
+    "5": "vanilla",
+    "7": "scheduler",
+    "8": "MPI",
+    "9": "grid",
+    "10": "java",
+    "11": "parallel",
+    "12": "local",
+    "13": "vm"
+}
+
+# Submit file commands and the job ClassAd attribute each one is restored from
+SUBMIT_COMMANDS = [
+    ("universe", "JobUniverse"),
+    ("environment", "Environment"),
+    ("accounting_group", "AcctGroup"),
+    ("request_cpus", "RequestCpus"),
+    ("request_memory", "RequestMemory"),
+    ("request_disk", "RequestDisk"),
+    ("log", "UserLog"),
+    ("out", "Out"),
+    ("error", "Err"),
+    ("executable", "Cmd"),
+    ("arguments", "Args"),
+    ("transfer_executable", "TransferExecutable"),
+    ("should_transfer_files", "ShouldTransferFiles"),
+    ("when_to_transfer_output", "WhenToTransferOutput"),
+    ("transfer_input_files", "TransferInput"),
+    ("transfer_output_files", "TransferOutput")
+]
+
+
 # Parse command-line options
 ###########################################
 def options():
@@ -13,7 +47,8 @@ def options():
     parser = argparse.ArgumentParser(description="Create HTCondor job description files from condor_history.",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-i", "--ids",
-                        help="One or more (comma-separated) HTCondor job IDs (cluster ID and process ID)",
+                        help="One or more (comma-separated) HTCondor job IDs (cluster ID and process ID), or cluster "
+                             "IDs to restore every job of the cluster",
                         required=True)
     args = parser.parse_args()
 
@@ -25,6 +60,9 @@ def options():
 def main():
     """Main program.
 
+    All the jobs are read from one condor_history call. The jobs of each cluster are written to one submit file,
+    cluster.condor.
+
     Args:
 
     Returns:
@@ -34,60 +72,196 @@ def main():
     """
     args = options()
 
-    # Job universe IDs
-    uni = {
-        "1": "standard",
-        "5": "vanilla",
-        "7": "scheduler",
-        "8": "MPI",
-        "9": "grid",
-        "10": "java",
-        "11": "parallel",
-        "12": "local",
-        "13": "vm"
-    }
-
-    ids = args.ids.split(",")
-    for job_id in ids:
-        job = {}
-        # Run condor_history to get job ClassAd
-        ps = Popen(["condor_history", "-long", job_id], stdout=PIPE)
-        stdout = ps.communicate()
-        # Process output
-        raw = stdout[0]
-        classad = raw.split("\n")
-        # Parse ClassAd attributes
-        for row in classad:
-            # Remove the newline if any
-            row = row.rstrip("\n")
-            # Split key and value pair
-            attributes = row.split(" = ")
-            if len(attributes) == 2:
-                job[attributes[0]] = attributes[1]
-        if len(job) > 0:
-            out = open(job["ClusterId"] + "." + job["ProcId"] + ".condor", "w")
-            out.write("# Job was run from " + job["Iwd"] + "\n\n")
-            out.write("universe = " + uni[job["JobUniverse"]] + "\n")
-            out.write("environment = " + job["Environment"] + "\n")
-            out.write("accounting_group = " + job["AcctGroup"] + "\n")
-            out.write("request_cpus = " + job["RequestCpus"] + "\n")
-            out.write("request_memory = " + job["RequestMemory"] + "\n")
-            out.write("request_disk = " + job["RequestDisk"] + "\n")
-            out.write("log = " + job["UserLog"] + "\n")
-            out.write("out = " + job["Out"] + "\n")
-            out.write("error = " + job["Err"] + "\n")
-            out.write("executable = " + job["Cmd"] + "\n")
-            if "Args" in job:
-                out.write("arguments = " + job["Args"] + "\n")
-            if "TransferExecutable" in job:
-                out.write("transfer_executable = " + job["TransferExecutable"] + "\n")
-            out.write("should_transfer_files = " + job["ShouldTransferFiles"] + "\n")
-            out.write("when_to_transfer_output = " + job["WhenToTransferOutput"] + "\n")
-            if "TransferInput" in job:
-                out.write("transfer_input_files = " + job["TransferInput"] + "\n")
-            if "TransferOutput" in job:
-                out.write("transfer_output_files = " + job["TransferOutput"] + "\n")
+    wanted = parse_ids(args.ids)
+
+    # Run condor_history once to get every job ClassAd
+    ps = Popen(history_command(wanted), stdout=PIPE, encoding="utf-8")
+    clusters = {}
+    for job in parse_classads(ps.stdout):
+        if "ClusterId" in job and "ProcId" in job:
+            clusters.setdefault(job["ClusterId"], []).append(job)
+    ps.stdout.close()
+    if ps.wait() != 0:
+        print("condor_history failed with exit code {0}".format(ps.returncode), file=sys.stderr)
+        sys.exit(1)
+
+    # Report the jobs that were not found in the history
+    for cluster, procs in sorted(wanted.items()):
+        found = set([job["ProcId"] for job in clusters.get(str(cluster), [])])
+        if procs is None and len(found) == 0:
+            print("Cluster {0} was not found in the history".format(cluster), file=sys.stderr)
+        for proc in sorted(procs or []):
+            if str(proc) not in found:
+                print("Job {0}.{1} was not found in the history".format(cluster, proc), file=sys.stderr)
+
+    for cluster, jobs in sorted(clusters.items(), key=lambda item: int(item[0])):
+        jobs.sort(key=lambda job: int(job["ProcId"]))
+        write_submit_file(filename=cluster + ".condor", jobs=jobs)
+
+
+# Parse job IDs
+###########################################
+def parse_ids(ids):
+    """Group the job IDs by cluster.
+
+    :param ids: str
+    :return wanted: dict
+    """
+    # Processes requested for each cluster, None for every process of the cluster
+    wanted = {}
+    for job_id in ids.split(","):
+        job_id = job_id.strip()
+        if not job_id:
+            continue
+        if "." in job_id:
+            cluster, proc = [int(value) for value in job_id.split(".")]
+            if cluster not in wanted:
+                wanted[cluster] = set()
+            if wanted[cluster] is not None:
+                wanted[cluster].add(proc)
+        else:
+            wanted[int(job_id)] = None
+    return wanted
+
+
+# Consecutive ranges
+###########################################
+def ranges(values):
+    """Group sorted integers into consecutive (first, last) ranges.
+
+    :param values: list
+    :return ranges: list
+    """
+    groups = []
+    for value in sorted(values):
+        if len(groups) > 0 and groups[-1][1] == value - 1:
+            groups[-1][1] = value
+        else:
+            groups.append([value, value])
+    return groups
+
+
+# Build the condor_history command
+###########################################
+def history_command(wanted):
+    """Build one condor_history command that returns every requested job.
+
+    condor_history scans the history file once for the OR'ed constraint. If only specific processes are requested,
+    -match stops the scan once all of them have been found.
+
+    :param wanted: dict
+    :return cmd: list
+    """
+    def range_term(attribute, first, last):
+        if first == last:
+            return "{0} == {1}".format(attribute, first)
+        return "({0} >= {1} && {0} <= {2})".format(attribute, first, last)
+
+    # Whole clusters
+    terms = [range_term("ClusterId", first, last)
+             for first, last in ranges([cluster for cluster, procs in wanted.items() if procs is None])]
+    # Processes of a cluster
+    for cluster, procs in sorted(wanted.items()):
+        if procs is not None:
+            terms.append("(ClusterId == {0} && ({1}))".format(cluster, " || ".join(
+                [range_term("ProcId", first, last) for first, last in ranges(procs)])))
+
+    cmd = ["condor_history", "-long", "-constraint", " || ".join(terms)]
+    if all([procs is not None for procs in wanted.values()]):
+        cmd.extend(["-match", str(sum([len(procs) for procs in wanted.values()]))])
+    return cmd
+
+
+# Parse condor_history -long output
+###########################################
+def parse_classads(lines):
+    """Parse job ClassAds, one attribute per line and separated by blank lines, as they are read.
+
+    :param lines: iterable
+    :return jobs: generator
+    """
+    job = {}
+    for row in lines:
+        # Remove the newline if any
+        row = row.rstrip("\n")
+        # A blank line ends the ClassAd
+        if row.strip() == "":
+            if len(job) > 0:
+                yield job
+            job = {}
+            continue
+        # Split key and value pair
+        attributes = row.split(" = ", 1)
+        if len(attributes) == 2:
+            job[attributes[0]] = attributes[1]
+    if len(job) > 0:
+        yield job
+
+
+# Write a submit file
+###########################################
+def write_submit_file(filename, jobs):
+    """Write the jobs of one cluster to a submit file.
+
+    Commands with the same value for every job are written once. Commands that differ between jobs are queued from
+    itemdata, one line per job, or written before a queue statement for each job if their values cannot be written
+    as itemdata.
+
+    :param filename: str
+    :param jobs: list
+    """
+    shared = []
+    varying = []
+    for command, attribute in SUBMIT_COMMANDS:
+        values = [job.get(attribute) for job in jobs]
+        if all([value is None for value in values]):
+            continue
+        if attribute == "JobUniverse":
+            values = [UNIVERSES.get(value, value) for value in values]
+        values = ["" if value is None else value for value in values]
+        if len(set(values)) == 1:
+            shared.append((command, values[0]))
+        else:
+            varying.append((command, attribute, values))
+
+    # Itemdata fields are separated by commas or spaces, only the last field can contain them
+    varying.sort(key=lambda item: any([not is_itemdata_field(value) for value in item[2]]))
+    itemdata = all([is_itemdata_field(value) for _, _, values in varying[:-1] for value in values]) and \
+        all(["\n" not in value and value.strip() != ")" for _, _, values in varying for value in values])
+
+    out = open(filename, "w")
+    out.write("# Job was run from " + jobs[0].get("Iwd", "") + "\n")
+    out.write("# Jobs " + ", ".join([job["ClusterId"] + "." + job["ProcId"] for job in jobs]) + "\n\n")
+    for command, value in shared:
+        out.write(command + " = " + value + "\n")
+    if len(varying) == 0:
+        out.write("queue" + (" " + str(len(jobs)) if len(jobs) > 1 else "") + "\n")
+    elif itemdata:
+        # Item variables are named after the job attributes
+        for command, attribute, _ in varying:
+            out.write(command + " = $(Item" + attribute + ")\n")
+        out.write("queue " + ",".join(["Item" + attribute for _, attribute, _ in varying]) + " from (\n")
+        for i in range(len(jobs)):
+            out.write(",".join([values[i] for _, _, values in varying]) + "\n")
+        out.write(")\n")
+    else:
+        for i in range(len(jobs)):
+            out.write("\n")
+            for command, _, values in varying:
+                out.write(command + " = " + values[i] + "\n")
             out.write("queue\n")
+    out.close()
+
+
+# Check an itemdata value
+###########################################
+def is_itemdata_field(value):
+    """Check whether a value can be an itemdata field other than the last one.
+
+    :param value: str
+    :return ok: bool
+    """
+    return value != "" and not any([char in value for char in " \t,"])
 
 
 if __name__ == '__main__':
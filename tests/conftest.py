@@ -0,0 +1,28 @@
+import os
+import sys
+import importlib.util
+import importlib.machinery
+
+
+# Repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Recorded HTCondor output
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+# The monitor scripts import their shared database module from the monitor directory
+sys.path.insert(0, os.path.join(ROOT, "monitor"))
+
+
+def load_script(path, name):
+    """Import a script that has no .py extension as a module.
+
+    :param path: str
+    :param name: str
+    :return module: module
+    """
+    loader = importlib.machinery.SourceFileLoader(name, os.path.join(ROOT, path))
+    spec = importlib.util.spec_from_loader(name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
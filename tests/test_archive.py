@@ -0,0 +1,93 @@
+import os
+import json
+import argparse
+import subprocess
+from conftest import FIXTURES, load_script
+
+
+archive = load_script(os.path.join("archive", "archive"), "archive")
+
+# Metadata written by archive local before this series, Archive.Path holds the local file path
+LEGACY_METADATA = os.path.join(FIXTURES, "reads.fastq.loc.archived")
+
+
+def read_metadata():
+    with open(LEGACY_METADATA, "r") as fh:
+        return json.load(fh)
+
+
+def test_archived_path_of_legacy_metadata():
+    assert archive.archived_path(read_metadata()) == "/volume1/archive/data/project/reads.fastq"
+
+
+def test_catalog_destination_of_legacy_metadata(tmp_path):
+    catalog = archive.open_catalog(os.path.join(str(tmp_path), "catalog.db"))
+    archive.catalog_add(catalog=catalog, service="local", target="archive.example.org:/volume1/archive",
+                        metadata=read_metadata())
+
+    path, destination = catalog.execute("SELECT path, destination FROM files").fetchone()
+    assert path == "/data/project/reads.fastq"
+    assert destination == "archive.example.org:/volume1/archive/data/project/reads.fastq"
+
+
+def test_verify_legacy_metadata_hashes_the_archived_copy(monkeypatch):
+    metadata = read_metadata()
+    requested = []
+
+    def remote_checksums(command, algorithm, paths):
+        requested.extend(paths)
+        return {"/volume1/archive/data/project/reads.fastq": metadata["File"]["Checksum"]["ChecksumValue"]}
+
+    monkeypatch.setattr(archive, "remote_checksums", remote_checksums)
+    # The local file was deleted, the archived copy is compared to the stored MD5
+    check = {"file": metadata["File"]["FileName"], "metadata": metadata, "hashes": {}, "errors": [], "status": None}
+    args = argparse.Namespace(algorithm="md5", batch_size=10, username="archiver",
+                              remote_command="ssh {username}@{hostname}")
+    archive.verify_remote_local(checks=[check], args=args)
+
+    assert requested == ["/volume1/archive/data/project/reads.fastq"]
+    assert check["errors"] == []
+
+
+def fake_rsync(remote_root, returncode=0, stderr=b""):
+    """Copy the requested files from a local directory standing in for the archive host."""
+    def run(cmd, input=None, **kwargs):
+        volume = cmd[-2].split(":", 1)[1]
+        for file in input.decode().split("\0"):
+            source = os.path.join(remote_root + volume, file)
+            if returncode == 0 and os.path.isfile(source):
+                os.makedirs(os.path.dirname(os.path.join(cmd[-1], file)), exist_ok=True)
+                with open(source, "rb") as src, open(os.path.join(cmd[-1], file), "wb") as dst:
+                    dst.write(src.read())
+        return subprocess.CompletedProcess(cmd, returncode, b"", stderr)
+    return run
+
+
+def test_restore_legacy_metadata(tmp_path, monkeypatch):
+    metadata = read_metadata()
+    # The archived copy is kept with its full path below the volume
+    remote_root = os.path.join(str(tmp_path), "remote")
+    os.makedirs(os.path.join(remote_root, "volume1/archive/data/project"))
+    with open(os.path.join(remote_root, "volume1/archive/data/project/reads.fastq"), "wb") as fh:
+        fh.write(b"@read1\nACGTACGTAC\n+\nIIIIIIIIII\n")
+    monkeypatch.setattr(archive.subprocess, "run", fake_rsync(remote_root))
+
+    destination = os.path.join(str(tmp_path), "restored", "reads.fastq")
+    results = archive.local_restore_files(hostname="archive.example.org", username="archiver",
+                                          path="/volume1/archive", items=[(metadata, destination)], ssh=["ssh"])
+
+    # The owner in the fixture may not exist on the test host
+    assert results[0] in ["SUCCESS", "NO_OWNER"]
+    with open(destination, "rb") as fh:
+        assert fh.read() == b"@read1\nACGTACGTAC\n+\nIIIIIIIIII\n"
+
+
+def test_restore_reports_rsync_errors_with_undecodable_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive.subprocess, "run", fake_rsync(os.path.join(str(tmp_path), "remote"), returncode=12,
+                                                              stderr=b"rsync: failed on \xff.fastq\n"))
+
+    destination = os.path.join(str(tmp_path), "restored", "reads.fastq")
+    results = archive.local_restore_files(hostname="archive.example.org", username="archiver",
+                                          path="/volume1/archive", items=[(read_metadata(), destination)],
+                                          ssh=["ssh"])
+    assert results == ["FAIL"]
@@ -0,0 +1,47 @@
+import os
+import pytest
+from conftest import FIXTURES, load_script
+
+
+condor_fullstat = load_script("condor_fullstat", "condor_fullstat")
+
+
+def parse_ads(filename):
+    """Parse recorded condor_q -long output into ClassAds with the installed bindings."""
+    try:
+        import classad
+    except ImportError:
+        classad = pytest.importorskip("classad2")
+    with open(os.path.join(FIXTURES, filename), "r") as fh:
+        return list(classad.parseAds(fh.read()))
+
+
+def test_bindings_rows_evaluate_expressions():
+    ads = parse_ads("condor_q_expressions.ads")
+    rows = condor_fullstat.ad_rows(ads=ads, attrs=condor_fullstat.JOB_ATTRS)
+    attrs = condor_fullstat.JOB_ATTRS
+
+    # MemoryUsage and RequestMemory are evaluated, not returned as expression text
+    assert rows[0][attrs.index("MemoryUsage")] == 3072
+    assert rows[0][attrs.index("RequestMemory")] == 3072
+    assert rows[0][attrs.index("RequestDisk")] == 51200
+    # An expression over a missing attribute evaluates to undefined
+    assert rows[1][attrs.index("MemoryUsage")] == "undefined"
+    # Missing attributes are undefined, like condor_q -autoformat
+    assert rows[1][attrs.index("AcctGroup")] == "undefined"
+    assert rows[2][attrs.index("RemoteHost")] == "undefined"
+
+
+def test_parse_jobs_accepts_evaluated_expressions():
+    ads = parse_ads("condor_q_expressions.ads")
+    rows = condor_fullstat.ad_rows(ads=ads, attrs=condor_fullstat.JOB_ATTRS)
+    columns = condor_fullstat.parse_jobs(rows=rows, loads={"101.0": "3.5"})
+
+    # The idle job without a host is dropped
+    assert list(columns["cluster"]) == ["101", "101"]
+    assert list(columns["request_memory"]) == [3072, 1536]
+    assert list(columns["memory_usage"]) == [3072, 0]
+    assert list(columns["request_disk"]) == [51200, 100]
+    assert list(columns["host"]) == ["node01.example.org", "node02.example.org"]
+    assert list(columns["group"]) == ["genomics", "None"]
+    assert list(columns["loadavg"]) == [3.5, 0.0]
@@ -0,0 +1,109 @@
+import os
+import sys
+import subprocess
+from conftest import FIXTURES, ROOT, load_script
+
+
+htcondor_event_log = load_script(os.path.join("monitor", "htcondor_event_log.py"), "htcondor_event_log")
+
+# Recorded log: job 200.0 runs and returns 0, job 200.1 is held and then removed with condor_rm
+USER_LOG = os.path.join(FIXTURES, "htcondor_user.log")
+
+
+def read_fixture():
+    with open(USER_LOG, "r") as fh:
+        return fh.read()
+
+
+def job_log(tmp_path, process, text=None):
+    """Write the events of one job of the recorded log to a new log."""
+    events = [event + "...\n" for event in (text or read_fixture()).split("...\n")[:-1]]
+    path = os.path.join(str(tmp_path), "job.log")
+    with open(path, "w") as fh:
+        fh.write("".join(event for event in events if "(200.{0:03d}.000)".format(process) in event))
+    return path
+
+
+def wait(path):
+    """Run the script with --wait and return its exit code."""
+    script = os.path.join(ROOT, "monitor", "htcondor_event_log.py")
+    return subprocess.run([sys.executable, script, "--wait", "--quiet", "--interval", "0.01", path],
+                          timeout=30).returncode
+
+
+def test_read_events_parses_recorded_log():
+    events = []
+    htcondor_event_log.read_all(paths=[USER_LOG], callback=events.append, state={})
+
+    assert [(event["type"], event["process"]) for event in events] == [
+        ("submit", 0), ("submit", 1), ("execute", 0), ("hold", 1), ("image_size", 0), ("abort", 1), ("terminate", 0)]
+    submit, _, execute, hold, image_size, abort, terminate = events
+
+    assert submit["cluster"] == 200
+    assert submit["time"] == "2026-10-16 09:00:01"
+    assert submit["host"] == "10.5.0.10"
+    assert execute["host"] == "10.5.0.21"
+    assert execute["slot"] == "slot1_3@node21.example.org"
+    assert hold["reason"].startswith("Error from slot1_4@node22.example.org: Failed to open")
+    assert hold["hold_code"] == 14
+    assert hold["hold_subcode"] == 2
+    assert image_size["image_size"] == 1843200
+    assert image_size["memory_usage"] == 1750
+    assert image_size["resident_set_size"] == 1792000
+    assert abort["reason"] == "via condor_rm (by user alice)"
+    assert "return_value" not in abort
+    assert terminate["return_value"] == 0
+    assert terminate["remote_user_cpu"] == 2 * 3600 + 31 * 60 + 10
+    assert terminate["remote_sys_cpu"] == 65
+    assert terminate["file"] == USER_LOG
+
+
+def test_read_events_waits_for_complete_events(tmp_path):
+    text = read_fixture()
+    path = os.path.join(str(tmp_path), "job.log")
+    # The terminate event is still being written
+    with open(path, "w") as fh:
+        fh.write(text[:text.rindex("...\n")])
+
+    state = {}
+    # Events that span chunks are only consumed once their separator has been read
+    events = list(htcondor_event_log.read_events(path=path, state=state, chunk_size=64))
+    assert [event["type"] for event in events][-1] == "abort"
+    assert list(htcondor_event_log.read_events(path=path, state=state, chunk_size=64)) == []
+
+    with open(path, "a") as fh:
+        fh.write("...\n")
+    events = list(htcondor_event_log.read_events(path=path, state=state, chunk_size=64))
+    assert [event["type"] for event in events] == ["terminate"]
+    assert state[path]["offset"] == len(text)
+
+
+def test_wait_exit_code(tmp_path):
+    # Every job returned 0
+    assert wait(job_log(tmp_path, process=0)) == 0
+    # A job returned 2
+    assert wait(job_log(tmp_path, process=0, text=read_fixture().replace("return value 0", "return value 2"))) == 1
+    # A job was removed
+    assert wait(USER_LOG) == 1
+
+
+def test_read_all_keeps_events_whose_callback_failed():
+    state = {}
+    seen = []
+    failures = ["hold"]
+
+    def callback(event):
+        # Fail once on the hold event
+        if event["type"] in failures:
+            failures.remove(event["type"])
+            raise RuntimeError("callback failed")
+        seen.append(event)
+
+    try:
+        htcondor_event_log.read_all(paths=[USER_LOG], callback=callback, state=state)
+    except RuntimeError:
+        pass
+    # The hold event is read again when reading resumes from the saved state
+    htcondor_event_log.read_all(paths=[USER_LOG], callback=callback, state=state)
+    assert [event["type"] for event in seen] == [
+        "submit", "submit", "execute", "hold", "image_size", "abort", "terminate"]